@@ -1,5 +1,7 @@
 from math import sin, cos, tan, exp, pi, sqrt
 
+import numpy as np
+
 
 # abs
 def fun_abs(number):
@@ -95,3 +97,188 @@ def fun_square(number):
 # Sawtooth
 def fun_sawtooth(number):
     return number - int(number)
+
+
+# Array versions of the functions above, for evaluating lots of nodes at once.
+# They take and return NumPy arrays, and results only differ by rounding from
+# the scalar functions. Most of them follow the scalar functions step by step.
+# Sigmoid and gauss, the slowest ones, are written to go through the array as
+# few times as possible instead
+
+def array_fun_abs(numbers):
+    return np.abs(numbers)
+
+
+def array_fun_sin(numbers):
+    return np.sin(numbers)
+
+
+def array_fun_sin_4x(numbers):
+    return np.sin(numbers * 4)
+
+
+def array_fun_sin_10x(numbers):
+    return np.sin(numbers * 10)
+
+
+def array_fun_cos(numbers):
+    return np.cos(numbers)
+
+
+def array_fun_cos_4x(numbers):
+    return np.cos(numbers * 4)
+
+
+def array_fun_cos_10x(numbers):
+    return np.cos(numbers * 10)
+
+
+def array_fun_tan(numbers):
+    return np.tan(numbers)
+
+
+def array_fun_tan_4x(numbers):
+    return np.tan(numbers * 4)
+
+
+def array_fun_tan_10x(numbers):
+    return np.tan(numbers * 10)
+
+
+def array_fun_ramp(numbers):
+    return np.array(numbers, dtype=float)
+
+
+# Same as fun_gauss, with the constants worked out once:
+# exp(-x ** 2 / (2 * sigma ** 2)) / (sigma * sqrt(2 * pi))
+gauss_sigma = 0.4
+gauss_exponent_factor = -1 / (2 * gauss_sigma ** 2)
+gauss_scale = 1 / (gauss_sigma * sqrt(2 * pi))
+
+
+def array_fun_gauss(numbers):
+    ans = np.square(numbers)
+    ans *= gauss_exponent_factor
+    np.exp(ans, out=ans)
+    ans *= gauss_scale
+    return ans
+
+
+def array_fun_step(numbers):
+    return np.where(numbers < 0, -1.0, 1.0)
+
+
+# 1 / (1 + exp(-x)) is 0.5 * tanh(x / 2) + 0.5, which only takes one call to a
+# NumPy function
+def array_fun_sigmoid(numbers):
+    ans = np.multiply(numbers, 0.5)
+    np.tanh(ans, out=ans)
+    ans *= 0.5
+    ans += 0.5
+    ans[numbers > 10] = 1
+    ans[numbers < -10] = 0
+    return ans
+
+
+def array_fun_abs_sqrt(numbers):
+    return np.sqrt(np.abs(numbers))
+
+
+def array_fun_square(numbers):
+    return numbers ** 2
+
+
+def array_fun_sawtooth(numbers):
+    return numbers - np.trunc(numbers)
+
+
+# Every activation function gets an integer id, its position in functions.
+# Nodes can then be tagged with ids, and a whole group of nodes using different
+# functions can be evaluated with one call per function instead of one per
+# node (see apply_functions).
+# Functions from somewhere else get an id the first time they are seen
+
+functions = [
+    fun_abs,
+    fun_sin,
+    fun_sin_4x,
+    fun_sin_10x,
+    fun_cos,
+    fun_cos_4x,
+    fun_cos_10x,
+    fun_tan,
+    fun_tan_4x,
+    fun_tan_10x,
+    fun_ramp,
+    fun_gauss,
+    fun_step,
+    fun_sigmoid,
+    fun_abs_sqrt,
+    fun_square,
+    fun_sawtooth
+]
+
+# Array versions, in the same order as functions
+array_functions = [
+    array_fun_abs,
+    array_fun_sin,
+    array_fun_sin_4x,
+    array_fun_sin_10x,
+    array_fun_cos,
+    array_fun_cos_4x,
+    array_fun_cos_10x,
+    array_fun_tan,
+    array_fun_tan_4x,
+    array_fun_tan_10x,
+    array_fun_ramp,
+    array_fun_gauss,
+    array_fun_step,
+    array_fun_sigmoid,
+    array_fun_abs_sqrt,
+    array_fun_square,
+    array_fun_sawtooth
+]
+
+function_ids = {function: function_id for function_id, function in enumerate(functions)}
+
+# Functions by name, as stored by save_network. Useful as the functions_dict of
+# load_network
+functions_by_name = {function.__name__: function for function in functions}
+
+
+def get_function_id(function):
+    function_id = function_ids.get(function)
+    if function_id is None:
+        function_id = len(functions)
+        functions.append(function)
+        # Functions without an array version are vectorized, which works, but
+        # slowly
+        array_function = np.vectorize(function, otypes=[float])
+        array_functions.append(array_function)
+        function_ids[function] = function_id
+        functions_by_name.setdefault(function.__name__, function)
+
+    return function_id
+
+
+def get_array_function(function):
+    return array_functions[get_function_id(function)]
+
+
+# Groups positions by function id. ids is an array with the function id of
+# every position, or -1 for the ones to leave out. Returns a list of
+# (positions, array function) pairs, to be used with apply_functions
+def get_function_groups(ids):
+    ids = np.asarray(ids)
+    groups = []
+    for function_id in np.unique(ids[ids >= 0]).tolist():
+        groups.append((np.flatnonzero(ids == function_id), array_functions[function_id]))
+
+    return groups
+
+
+# Applies the function of every group to its positions of values. Results go to
+# the same positions of out
+def apply_functions(groups, values, out):
+    for positions, array_function in groups:
+        out[positions] = array_function(values[positions])
@@ -0,0 +1,867 @@
+"""
+A few benchmarks for the parts of the simulation that get slow when there are
+lots of cats. Run this script to print the results to console.
+"""
+
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import activation_functions
+import brain_archive
+import evolution
+import genome
+import islands
+import neural_network as nn
+import speciation
+from evolution import EvolutionOptions
+from simulation import Simulation, SimulationBaseObject, Cat
+from population_inference import PopulationInferenceEngine
+from random_streams import RandomStream
+
+
+# How SimulationBaseObject used to handle transforms: every movement eagerly
+# recomputes the world transform of the object and all of its descendants,
+# going through polar coordinates for every point. It's kept here as a
+# reference for the transform benchmark.
+class EagerTransformNode:
+
+    def __init__(self):
+        self.position = [0, 0]
+        self.rotation = 0
+        self.world_position = [0, 0]
+        self.world_rotation = 0
+        self.parent = None
+        self.children = []
+
+    def set_parent(self, parent):
+        self.parent = parent
+        parent.children.append(self)
+        self.update()
+
+    def get_world_position(self, local_position):
+        r = math.sqrt((local_position[0] ** 2) + (local_position[1] ** 2))
+        theta = math.atan2(local_position[1], local_position[0])
+
+        x = r * math.cos(theta + self.world_rotation)
+        y = r * math.sin(theta + self.world_rotation)
+
+        return [local + world for local, world in zip([x, y], self.world_position)]
+
+    def get_world_rotation(self, local_rotation):
+        return math.fmod(local_rotation + self.world_rotation, math.pi * 2)
+
+    def update(self):
+        if self.parent is not None:
+            self.world_rotation = self.parent.get_world_rotation(self.rotation)
+            self.world_position = self.parent.get_world_position(self.position)
+        else:
+            self.world_rotation = self.rotation
+            self.world_position = self.position
+
+        for child in self.children:
+            child.update()
+
+    def increment_position_rotation(self, position_increment, rotation_increment):
+        self.position = [original + increment for original, increment in zip(self.position, position_increment)]
+        self.rotation += rotation_increment
+        self.update()
+
+
+# A chain of nodes, each one the child of the previous one. Returns the first
+# and the last node
+def build_deep_hierarchy(node_class, depth):
+    root = node_class()
+    node = root
+    for i in range(0, depth):
+        child = node_class()
+        child.position = [10, 0]
+        child.rotation = 0.1
+        child.set_parent(node)
+        node = child
+
+    return root, node
+
+
+# A root with many children (like cats in the arena), each one with a few
+# children of their own (like sensors). Returns the children and grandchildren
+def build_wide_hierarchy(node_class, width, grandchildren):
+    root = node_class()
+    children = []
+    leaves = []
+    for i in range(0, width):
+        child = node_class()
+        child.position = [i, i]
+        child.set_parent(root)
+        children.append(child)
+
+        for j in range(0, grandchildren):
+            leaf = node_class()
+            leaf.rotation = j * 0.5
+            leaf.set_parent(child)
+            leaves.append(leaf)
+
+    return children, leaves
+
+
+def benchmark_transforms(repetitions=200):
+    print("Transforms (seconds for {} ticks)".format(repetitions))
+
+    for node_class in (EagerTransformNode, SimulationBaseObject):
+        root, leaf = build_deep_hierarchy(node_class, 50)
+
+        # Move the root several times per tick, but only read the leaf once
+        def deep_tick():
+            for i in range(0, 5):
+                root.increment_position_rotation([1, 1], 0.01)
+            return leaf.world_position
+
+        deep_time = timeit.timeit(deep_tick, number=repetitions)
+
+        children, leaves = build_wide_hierarchy(node_class, 300, 6)
+
+        # Move every child once, then read every leaf once, like a simulation
+        # step where every cat moves and every sensor looks around
+        def wide_tick():
+            for child in children:
+                child.increment_position_rotation([1, 0], 0.01)
+            for leaf in leaves:
+                leaf.world_position
+                leaf.world_rotation
+
+        wide_time = timeit.timeit(wide_tick, number=repetitions)
+
+        print("    {:<22} deep: {:.4f}    wide: {:.4f}".format(node_class.__name__, deep_time, wide_time))
+
+
+# Same settings used by Alife1App
+def get_evolution_options():
+    evolution_options = EvolutionOptions()
+    evolution_options.gene_mutation_probability = 0.1
+    evolution_options.weight_perturbation_probability = 0.8
+    evolution_options.weight_perturbation_max_delta = 0.5
+    evolution_options.weight_random_mutation_range = 3
+    evolution_options.activation_functions.append(activation_functions.fun_sigmoid)
+    return evolution_options
+
+
+# How simulation objects used to be stored, before __slots__: every attribute
+# in a per-object __dict__, and every object with its own children dict,
+# position constraints and tag list. Only used as a reference by
+# benchmark_memory
+class UnslottedObject:
+    pass
+
+
+def make_unslotted_copy(instance):
+    copy = UnslottedObject()
+    for cls in type(instance).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(instance, name):
+                setattr(copy, name, getattr(instance, name))
+
+    copy.children = dict(instance.children)
+    copy.position_constraints = dict(instance.position_constraints)
+    copy.tags = list(instance.tags)
+    return copy
+
+
+# Bytes allocated per cat, counting its sensors and its brain. Pictures are
+# stored by SDL, so they are not included. The unslotted figure swaps the cat
+# and its sensors for UnslottedObject copies, as they were before __slots__
+def benchmark_memory(cat_count=500):
+    evolution_options = get_evolution_options()
+
+    cats = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(0, cat_count):
+        cat = Cat(40, 300, 400, evolution_options)
+        cat.new_brain()
+        cats.append(cat)
+    after = tracemalloc.take_snapshot()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+    objects = [obj for cat in cats for obj in [cat] + list(cat.children)]
+    slotted_size = sum(sys.getsizeof(obj) for obj in objects)
+
+    before = tracemalloc.take_snapshot()
+    copies = [make_unslotted_copy(obj) for obj in objects]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Leaves the list holding the copies out
+    unslotted_size = sum(stat.size_diff for stat in after.compare_to(before, "filename")) - sys.getsizeof(copies)
+    unslotted_allocated = allocated - slotted_size + unslotted_size
+
+    print("Memory")
+    print("    {:,} bytes per cat (including sensors and brain)".format(int(allocated / cat_count)))
+    print("    {:,} bytes per cat with unslotted objects".format(int(unslotted_allocated / cat_count)))
+
+    for cat in cats:
+        cat.destroy()
+
+
+# One brain step for a whole population, one cat at a time (with compiled and
+# generated networks) versus all of them at once with PopulationInferenceEngine
+def benchmark_brains(cat_count=1000, repetitions=100):
+    evolution_options = get_evolution_options()
+
+    cats = []
+    for i in range(0, cat_count):
+        cat = Cat(40, 300, 400, evolution_options)
+        cat.new_brain()
+        cats.append(cat)
+
+    engine = PopulationInferenceEngine(Cat.brain_input_keys, Cat.brain_output_nodes)
+    slots = [engine.add(cat.brain.network) for cat in cats]
+    inputs = [[0.5] * len(Cat.brain_input_keys) for cat in cats]
+
+    def single_tick(networks):
+        for network, cat_inputs in zip(networks, inputs):
+            network.set_inputs(dict(zip(Cat.brain_input_keys, cat_inputs)))
+            network.activate()
+            network.get_outputs()
+
+    def batch_tick():
+        engine.activate(slots, inputs).tolist()
+
+    compiled_networks = [cat.brain.network for cat in cats]
+    for cat in cats:
+        cat.brain.network_class = nn.GeneratedNetwork
+        cat.brain.changelog = None
+    generated_networks = [cat.brain.build_network() for cat in cats]
+
+    compiled_time = timeit.timeit(lambda: single_tick(compiled_networks), number=repetitions)
+    generated_time = timeit.timeit(lambda: single_tick(generated_networks), number=repetitions)
+    batch_time = timeit.timeit(batch_tick, number=repetitions)
+
+    print("Brains ({} cats, seconds for {} ticks)".format(cat_count, repetitions))
+    print("    {:<22} {:.4f}".format("one at a time", compiled_time))
+    print("    {:<22} {:.4f}".format("generated code", generated_time))
+    print("    {:<22} {:.4f}".format("all at once", batch_time))
+
+    for cat in cats:
+        cat.destroy()
+
+
+# Steps every brain's network both as an nn.Network and compiled (the
+# CompiledNetwork Brain.build_network made, and a GeneratedNetwork), with the
+# same inputs, and checks they all give the same outputs. Half of the brains
+# allow recurrency, so their networks can have loops
+def check_compiled_networks(brain_count=200, mutations=10, steps=20):
+    evolution_options = get_evolution_options()
+    generator = random.Random(0)
+
+    recurrent_count = 0
+    for index in range(0, brain_count):
+        brain = evolution.Brain(
+            input_keys=list(Cat.brain_input_keys),
+            output_nodes=dict(Cat.brain_output_nodes),
+            evolution_options=evolution_options
+        )
+        brain.allow_recurrency = index % 2 == 0
+        brain.rng = RandomStream(index)
+        brain.randomize_genotype()
+        for i in range(0, mutations):
+            brain.random_new_connection()
+            brain.random_insert_node()
+            brain.mutate_genotype()
+        compiled_network = brain.build_network()
+
+        network = brain.make_network_graph()[0]
+        if nn.break_network_loops(brain.make_network_graph()[0]):
+            recurrent_count += 1
+        generated_network = network.compile(nn.GeneratedNetwork)
+
+        for step in range(0, steps):
+            inputs = {key: generator.uniform(-1, 1) for key in Cat.brain_input_keys}
+            outputs = []
+            for each_network in (network, compiled_network, generated_network):
+                each_network.set_inputs(inputs)
+                each_network.activate()
+                outputs.append(each_network.get_outputs())
+
+            assert outputs[0] == outputs[1] == outputs[2], (index, step, outputs)
+
+    print("Compiled networks")
+    print("    same outputs for {} brains ({} with loops), {} steps each".format(
+        brain_count, recurrent_count, steps
+    ))
+
+
+# How array_fun_sigmoid and array_fun_gauss used to work, following the scalar
+# functions step by step. Only used as a reference by benchmark_activations
+def step_by_step_fun_sigmoid(numbers):
+    ans = 1 / (1 + np.exp(-np.clip(numbers, -10, 10)))
+    ans[numbers > 10] = 1
+    ans[numbers < -10] = 0
+    return ans
+
+
+def step_by_step_fun_gauss(numbers):
+    sigma = 0.4
+    power = (numbers / sigma) ** 2
+    power *= (-1/2)
+    exponential = np.exp(power)
+    denominator = math.sqrt(2 * math.pi)
+    denominator *= sigma
+
+    return exponential / denominator
+
+
+# Array sigmoid and gauss against their step by step versions, on arrays of
+# several sizes (seconds for the given repetitions). Both have to match the
+# scalar functions, up to rounding
+def benchmark_activations(sizes=(100, 3000, 30000), repetitions=2000):
+    generator = np.random.default_rng(0)
+
+    print("Activation functions (seconds for {} calls)".format(repetitions))
+    for function, step_by_step_function in (
+            (activation_functions.fun_sigmoid, step_by_step_fun_sigmoid),
+            (activation_functions.fun_gauss, step_by_step_fun_gauss)
+    ):
+        array_function = activation_functions.get_array_function(function)
+
+        for size in sizes:
+            numbers = generator.normal(0, 4, size)
+            step_by_step_time = min(timeit.repeat(lambda: step_by_step_function(numbers), number=repetitions, repeat=3))
+            array_time = min(timeit.repeat(lambda: array_function(numbers), number=repetitions, repeat=3))
+
+            expected = np.array([function(number) for number in numbers.tolist()])
+            error = np.max(np.abs(array_function(numbers) - expected))
+            assert error < 1e-15, (function.__name__, error)
+
+            print("    {:<12} {:>6} values    step by step: {:.4f}    array: {:.4f}    max error: {:.1e}".format(
+                function.__name__, size, step_by_step_time, array_time, error
+            ))
+
+
+# A network with random connections between node_count hidden nodes, about
+# connections_per_node per node, so there are plenty of loops
+def build_random_network(node_count, connections_per_node=2, seed=0):
+    generator = random.Random(seed)
+    network = nn.Network()
+    for key in range(0, node_count):
+        network.add_hidden_node(key)
+    for i in range(0, node_count * connections_per_node):
+        network.add_connection(1, generator.randrange(node_count), generator.randrange(node_count))
+
+    return network
+
+
+# Breaking every loop of a network, calling break_loops on every node (as
+# Brain.build_network used to do) versus break_network_loops. break_loops goes
+# through every path, so it's only run on the smaller networks
+def benchmark_loop_breaking(node_counts=(10, 30, 70, 200, 500, 2000), break_loops_max_nodes=70):
+    print("Loop breaking (seconds)")
+
+    for node_count in node_counts:
+        network = build_random_network(node_count)
+        start = time.perf_counter()
+        broken_connections = nn.break_network_loops(network)
+        new_time = time.perf_counter() - start
+
+        old_time = "-"
+        if node_count <= break_loops_max_nodes:
+            network = build_random_network(node_count)
+            start = time.perf_counter()
+            old_broken_connections = []
+            for node in network.nodes.values():
+                old_broken_connections += nn.break_loops(node)
+            old_time = "{:.4f}".format(time.perf_counter() - start)
+
+            assert old_broken_connections == broken_connections
+
+        print("    {:>5} nodes    break_loops: {:>8}    break_network_loops: {:.4f}    ({} broken)".format(
+            node_count, old_time, new_time, len(broken_connections)
+        ))
+
+
+def describe_network(network):
+    nodes = [
+        (key, node.activation_function, [n.id for n in node.inputs], node.conn_weights)
+        for key, node in network.nodes.items()
+    ]
+    return nodes, network.input_nodes_keys, network.output_nodes_keys
+
+
+# Saving and loading networks with save_network/load_network versus the
+# binary format, and reading single brains from a population archive. Every
+# network is checked to come back the same way in both formats
+def benchmark_serialization(cat_count=500, archive_size=100000, reads=1000):
+    evolution_options = get_evolution_options()
+    evolution_options.node_insertion_chance = 0.5
+    evolution_options.new_connection_chance = 0.5
+
+    brains = []
+    for i in range(0, cat_count):
+        cat = Cat(40, 300, 400, evolution_options)
+        cat.new_brain()
+        for j in range(0, 5):
+            cat.brain.random_insert_node()
+            cat.brain.random_new_connection()
+        brains.append(cat.brain)
+        cat.destroy()
+
+    networks = []
+    for brain in brains:
+        network = nn.Network()
+        for key in brain.input_keys:
+            network.add_input_node(key)
+        for key, function in brain.output_nodes.items():
+            network.add_output_node(key, function)
+        genotype = brain.genotype.to_dict()
+        for gene in genotype.values():
+            if gene["enable"] and gene["type"] == "node":
+                network.add_hidden_node(gene["key"], gene["activation_function"])
+        for gene in genotype.values():
+            if gene["enable"] and gene["type"] == "connection":
+                network.add_connection(gene["weight"], gene["conn"][0], gene["conn"][1])
+        networks.append(network)
+
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "network.txt")
+    binary_path = os.path.join(directory, "network.bin")
+
+    text_time = binary_time = 0
+    text_size = binary_size = 0
+    for network in networks:
+        start = time.perf_counter()
+        nn.save_network(network, text_path)
+        text_network = nn.load_network(text_path, activation_functions.functions_by_name)
+        text_time += time.perf_counter() - start
+        text_size += os.path.getsize(text_path)
+
+        start = time.perf_counter()
+        brain_archive.save_network_binary(network, binary_path)
+        binary_network = brain_archive.load_network_binary(binary_path)
+        binary_time += time.perf_counter() - start
+        binary_size += os.path.getsize(binary_path)
+
+        assert describe_network(text_network) == describe_network(binary_network) == describe_network(network)
+
+    print("Serialization ({} networks, save and load)".format(cat_count))
+    print("    {:<22} {:.4f} s    {:,} bytes".format("text", text_time, text_size))
+    print("    {:<22} {:.4f} s    {:,} bytes".format("binary", binary_time, binary_size))
+
+    # The archive repeats the same brains over and over
+    archive_path = os.path.join(directory, "population.alba")
+    start = time.perf_counter()
+    f = open(archive_path, "wb")
+    writer = brain_archive.BrainArchiveWriter(f)
+    for i in range(0, archive_size):
+        writer.add(brains[i % cat_count])
+    writer.close()
+    f.close()
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    archive = brain_archive.open_archive(archive_path, evolution_options)
+    open_time = time.perf_counter() - start
+
+    generator = random.Random(0)
+    start = time.perf_counter()
+    for i in range(0, reads):
+        position = generator.randrange(archive_size)
+        assert archive.load_brain(position).genotype.to_dict() == brains[position % cat_count].genotype.to_dict()
+    read_time = time.perf_counter() - start
+    archive.close()
+
+    print("Brain archive ({:,} brains, {:,} bytes)".format(archive_size, os.path.getsize(archive_path)))
+    print("    write: {:.4f} s    open: {:.4f} s    {} random reads: {:.4f} s".format(
+        write_time, open_time, reads, read_time
+    ))
+
+    os.remove(text_path)
+    os.remove(binary_path)
+    os.remove(archive_path)
+    os.rmdir(directory)
+
+
+# How Brain.mutate_genotype used to work, one gene at a time. It's kept here as
+# a reference for the mutation benchmark
+def mutate_genotype_by_gene(brain):
+    options = brain.evolution_options
+    genotype = brain.genotype
+
+    for row in genotype.get_rows(genome.NODE, enabled=True):
+        if evolution.chance(options.gene_mutation_probability):
+            brain.randomize_gene(row)
+            brain.log_change("function", row)
+
+    for row in genotype.get_rows(genome.CONNECTION, enabled=True):
+        if evolution.chance(options.gene_mutation_probability):
+            if evolution.chance(options.weight_perturbation_probability):
+                perturbation_delta = random.uniform(0, options.weight_perturbation_max_delta)
+                genotype.weights[row] += random.choice([perturbation_delta, -perturbation_delta])
+            else:
+                brain.randomize_gene(row)
+            brain.log_change("weight", row)
+
+        if evolution.chance(options.connection_disable_probability):
+            genotype.enabled[row] = False
+            brain.log_change("disable", row)
+
+
+# Checks that an observed frequency is within a few standard errors of the
+# expected probability
+def check_frequency(name, count, total, probability, errors=5):
+    observed = count / total
+    tolerance = errors * math.sqrt(probability * (1 - probability) / total) + 1e-12
+    assert abs(observed - probability) <= tolerance, (name, observed, probability)
+    print("    {:<22} {:.4f} (expected {:.4f})".format(name, observed, probability))
+
+
+# Mutating the genotypes of a population one gene at a time (as
+# Brain.mutate_genotype used to do) versus mutate_brains, which mutates all of
+# them at once. Then the frequency of every kind of mutation is checked against
+# the probabilities in the evolution options
+def benchmark_mutation(cat_count=1000, repetitions=10, genome_size=1000, genome_count=200):
+    evolution_options = get_evolution_options()
+    evolution_options.connection_disable_probability = 0.05
+
+    brains = []
+    for i in range(0, cat_count):
+        cat = Cat(40, 300, 400, evolution_options)
+        cat.new_brain()
+        for j in range(0, 5):
+            cat.brain.random_insert_node()
+            cat.brain.random_new_connection()
+        brains.append(cat.brain)
+        cat.destroy()
+
+    def by_gene():
+        for brain in brains:
+            mutate_genotype_by_gene(brain)
+
+    by_gene_time = timeit.timeit(by_gene, number=repetitions)
+    batch_time = timeit.timeit(lambda: evolution.mutate_brains(brains), number=repetitions)
+
+    print("Mutation ({} brains, seconds for {} generations)".format(cat_count, repetitions))
+    print("    {:<22} {:.4f}".format("one gene at a time", by_gene_time))
+    print("    {:<22} {:.4f}".format("all at once", batch_time))
+
+    # Big genomes with known starting weights and functions, so every kind of
+    # mutation can be told apart. fun_abs is not among the functions mutations
+    # choose from, so every mutated node changes its function
+    start_weight = 100
+    template = genome.Genome(genome_size * 2)
+    for i in range(0, genome_size):
+        template.add_node(i * 2, i, activation_functions.fun_abs)
+        template.add_connection(i * 2 + 1, i, i + 1, start_weight)
+    genomes = [template.copy() for i in range(0, genome_count)]
+    changes = evolution.mutate_genomes(genomes, evolution_options)
+
+    connections = genome_count * genome_size
+    weights = np.concatenate([g.weights[g.get_rows(genome.CONNECTION)] for g in genomes])
+    enabled = np.concatenate([g.enabled[g.get_rows(genome.CONNECTION)] for g in genomes])
+    functions = np.concatenate([g.activation_ids[g.get_rows(genome.NODE)] for g in genomes])
+    perturbed = weights[weights != start_weight] - start_weight
+    perturbed = perturbed[np.abs(perturbed) <= evolution_options.weight_perturbation_max_delta]
+    randomized = weights[np.abs(weights) <= evolution_options.weight_random_mutation_range]
+
+    p = evolution_options.gene_mutation_probability
+    q = evolution_options.weight_perturbation_probability
+    print("Mutation frequencies ({:,} genes)".format(connections * 2))
+    check_frequency("node mutated", np.count_nonzero(functions != template.activation_ids[0]), connections, p)
+    check_frequency("weight perturbed", len(perturbed), connections, p * q)
+    check_frequency("weight randomized", len(randomized), connections, p * (1 - q))
+    check_frequency("connection disabled", np.count_nonzero(~enabled), connections,
+                    evolution_options.connection_disable_probability)
+    check_frequency("positive perturbation", np.count_nonzero(perturbed > 0), len(perturbed), 0.5)
+    check_frequency("positive random weight", np.count_nonzero(randomized > 0), len(randomized), 0.5)
+    check_frequency("perturbation < half", np.count_nonzero(
+        np.abs(perturbed) < evolution_options.weight_perturbation_max_delta / 2
+    ), len(perturbed), 0.5)
+    check_frequency("random weight < half", np.count_nonzero(
+        np.abs(randomized) < evolution_options.weight_random_mutation_range / 2
+    ), len(randomized), 0.5)
+
+    # Mutated nodes choose evenly between the allowed functions
+    function_count = len(evolution_options.activation_functions)
+    for f in evolution_options.activation_functions:
+        check_frequency(f.__name__, np.count_nonzero(functions == activation_functions.get_function_id(f)),
+                        connections, p / function_count)
+
+    # Every change is reported
+    assert sum(len(genome_changes) for genome_changes in changes) == \
+        np.count_nonzero(functions != template.activation_ids[0]) + \
+        np.count_nonzero(weights != start_weight) + np.count_nonzero(~enabled)
+
+
+# Clones brains (mutating them like Cat.split does), and checks that every
+# network Brain.build_network patched (see Brain.patch_network) is the same as
+# building it from scratch: same weights and activation functions, and the
+# same outputs, step after step
+def check_patched_networks(clone_count=300, population_size=60, steps=5):
+    evolution_options = get_evolution_options()
+    evolution_options.gene_mutation_probability = 0.3
+    evolution_options.node_insertion_chance = 0.1
+    evolution_options.new_connection_chance = 0.1
+    evolution_options.connection_disable_probability = 0.001
+    evolution_options.activation_functions = [
+        activation_functions.fun_sigmoid,
+        activation_functions.fun_sin,
+        activation_functions.fun_gauss,
+        activation_functions.fun_tan
+    ]
+    generator = random.Random(0)
+
+    population = []
+    for index in range(0, population_size):
+        brain = evolution.Brain(
+            input_keys=list(Cat.brain_input_keys),
+            output_nodes=dict(Cat.brain_output_nodes),
+            evolution_options=evolution_options
+        )
+        brain.allow_recurrency = index % 2 == 0
+        brain.rng = RandomStream(index)
+        brain.randomize_genotype()
+        for i in range(0, 3):
+            brain.random_new_connection()
+        brain.build_network()
+        population.append(brain)
+
+    patched_count = 0
+    for index in range(0, clone_count):
+        clone = generator.choice(population).clone(RandomStream(population_size + index))
+        patched = clone.network is not None and \
+            all(change in ("weight", "function") for change, key in clone.changelog)
+        patched_count += patched
+
+        reference = clone.copy()
+        reference.network = None
+        reference.changelog = None
+
+        network = clone.build_network()
+        reference_network = reference.build_network()
+
+        assert network.node_keys == reference_network.node_keys
+        assert np.array_equal(network.sources, reference_network.sources)
+        assert np.array_equal(network.weights, reference_network.weights)
+        assert np.array_equal(network.activation_ids, reference_network.activation_ids)
+        for step in range(0, steps):
+            inputs = {key: generator.uniform(-1, 1) for key in Cat.brain_input_keys}
+            network.set_inputs(inputs)
+            network.activate()
+            reference_network.set_inputs(inputs)
+            reference_network.activate()
+            assert network.get_outputs() == reference_network.get_outputs(), (index, step)
+
+        population.append(clone)
+        population.pop(0)
+
+    print("Patched networks")
+    print("    {} clones, {} patched, all the same as built from scratch".format(clone_count, patched_count))
+
+
+# NEAT compatibility distance between two genomes, the simple way: going
+# through their genes one by one. Used to check SpeciesSet.get_table_distances
+def get_naive_distance(species_set, genotype, other_genotype):
+    genes = []
+    for each_genome in (genotype, other_genotype):
+        genes.append({
+            each_genome.innovations.item(row): (
+                (
+                    each_genome.types.item(row),
+                    each_genome.node_keys[each_genome.in_nodes.item(row)],
+                    each_genome.node_keys[each_genome.out_nodes.item(row)]
+                ),
+                each_genome.weights.item(row)
+            )
+            for row in range(0, each_genome.count)
+        })
+
+    matching = [
+        innovation for innovation, (signature, weight) in genes[0].items()
+        if innovation in genes[1] and genes[1][innovation][0] == signature
+    ]
+    weight_differences = [
+        abs(genes[0][innovation][1] - genes[1][innovation][1]) for innovation in matching
+        if genes[0][innovation][0][0] == genome.CONNECTION
+    ]
+
+    last = [max(each_genes, default=-1) for each_genes in genes]
+    if last[0] > last[1]:
+        excess = len([innovation for innovation in genes[0] if innovation > last[1]])
+    else:
+        excess = len([innovation for innovation in genes[1] if innovation > last[0]])
+    disjoint = len(genes[0]) + len(genes[1]) - 2 * len(matching) - excess
+
+    size = max(len(genes[0]), len(genes[1]))
+    if size < species_set.small_genome_size:
+        size = 1
+    mean_weight_difference = sum(weight_differences) / len(weight_differences) if weight_differences else 0
+
+    return (
+        species_set.excess_coefficient * excess / size +
+        species_set.disjoint_coefficient * disjoint / size +
+        species_set.weight_coefficient * mean_weight_difference
+    )
+
+
+# Checks SpeciesSet.get_distances against get_naive_distance, for genomes from
+# several lineages (so some innovation numbers mean different genes) and of
+# different sizes. Small chunks are used, so genomes are split in chunks too
+def check_species_distances(genome_count=40, representative_count=20, generations=20, clones_per_generation=20):
+    evolution_options = get_evolution_options()
+    evolution_options.node_insertion_chance = 0.8
+    evolution_options.new_connection_chance = 0.8
+    evolution_options.connection_disable_probability = 0.05
+
+    brains = []
+    for index in range(0, 10):
+        brain = evolution.Brain(
+            input_keys=list(Cat.brain_input_keys),
+            output_nodes=dict(Cat.brain_output_nodes),
+            evolution_options=evolution_options
+        )
+        brain.rng = RandomStream(index)
+        brain.randomize_genotype()
+        brains.append(brain)
+    generator = random.Random(0)
+    for i in range(0, generations):
+        brains += evolution.clone_brains([generator.choice(brains) for j in range(0, clones_per_generation)])
+
+    genomes = [generator.choice(brains).genotype for i in range(0, genome_count)]
+    representatives = [generator.choice(brains).genotype for i in range(0, representative_count)]
+
+    species_set = speciation.SpeciesSet()
+    species_set.max_chunk_size = 1000
+    distances = species_set.get_distances(
+        [species_set.get_genes(genotype) for genotype in genomes],
+        [species_set.get_genes(genotype) for genotype in representatives]
+    )
+    naive_distances = np.array([
+        [get_naive_distance(species_set, genotype, representative) for representative in representatives]
+        for genotype in genomes
+    ])
+
+    error = np.max(np.abs(distances - naive_distances))
+    assert error < 1e-12, error
+
+    print("Species distances")
+    print("    {} x {} genomes ({} to {} genes), same as gene by gene (max difference {:.1e})".format(
+        genome_count, representative_count, min(genotype.count for genotype in genomes + representatives),
+        max(genotype.count for genotype in genomes + representatives), error
+    ))
+
+
+# Sorting a population into species, and adding single newborns to them
+def benchmark_speciation(cat_count=2000, generations=5, newborns=200):
+    evolution_options = get_evolution_options()
+    evolution_options.node_insertion_chance = 0.5
+    evolution_options.new_connection_chance = 0.5
+
+    brains = []
+    for i in range(0, 50):
+        cat = Cat(40, 300, 400, evolution_options)
+        cat.new_brain()
+        brains.append(cat.brain)
+        cat.destroy()
+    for i in range(0, generations):
+        brains += evolution.clone_brains([random.choice(brains) for j in range(0, len(brains))])
+    genomes = [random.choice(brains).genotype for i in range(0, cat_count)]
+
+    species_set = speciation.SpeciesSet()
+    speciate_time = timeit.timeit(lambda: species_set.speciate(genomes), number=1)
+    add_time = timeit.timeit(lambda: [species_set.add(genome) for genome in genomes[:newborns]], number=1)
+
+    print("Speciation ({} cats, {} species)".format(cat_count, len(species_set)))
+    print("    speciate: {:.4f} s    {} newborns: {:.4f} s".format(speciate_time, newborns, add_time))
+
+
+# Runs islands for a while with growing pool sizes. Islands only trade cats
+# every migration_period, so steps per second should grow with the number of
+# islands, up to the number of cores. Then a run with several islands is
+# repeated, to check runs with the same seed go the same way
+def benchmark_islands(island_counts=(1, 2, 4), seconds=20, migration_period=10):
+    print("Islands ({} simulated seconds, {} cores)".format(seconds, os.cpu_count()))
+
+    results = dict()
+    for island_count in island_counts:
+        runner = islands.IslandRunner(island_count, seed=1, migration_period=migration_period)
+        with runner:
+            start = time.perf_counter()
+            runner.run(seconds)
+            elapsed = time.perf_counter() - start
+            results[island_count] = runner.get_progress()
+
+        print("    {} islands: {:.2f} s    {:,.0f} steps/s    {} cats    {} migrations".format(
+            island_count,
+            elapsed,
+            results[island_count]["steps_per_second"],
+            results[island_count]["cats"],
+            results[island_count]["migrations"]
+        ))
+
+    # A run with several islands, repeated, has to end the same way, cat by
+    # cat, after some of them moved between islands
+    island_count = max(2, island_counts[0])
+    periods = max(2, round(seconds / migration_period))
+    populations = []
+    for i in range(0, 2):
+        with islands.IslandRunner(island_count, seed=1, migration_period=migration_period) as runner:
+            runner.run(periods * migration_period)
+            assert runner.migrations >= 1
+            populations.append(runner.get_populations())
+
+    assert populations[0] == populations[1]
+    print("    repeated run with {} islands: same {} cats, after {} migrations".format(
+        island_count, sum(len(population["cats"]) for population in populations[0]), runner.migrations
+    ))
+
+
+# Runs a big world for a while with and without worker processes (see
+# parallel_tick). Runs with the same seed should end the same way whatever
+# the number of workers
+def benchmark_parallel_tick(cat_count=1000, burger_count=500, worker_counts=(0, 2, 4), seconds=2):
+    print("Parallel tick ({} cats, {} simulated seconds, {} cores)".format(cat_count, seconds, os.cpu_count()))
+
+    states = dict()
+    for worker_count in worker_counts:
+        simulation = Simulation()
+        simulation.world_seed = 1
+        simulation.min_cats = cat_count
+        simulation.max_burgers = burger_count
+        simulation.worker_processes = worker_count
+        simulation.start()
+
+        start = time.perf_counter()
+        simulation.run(seconds)
+        elapsed = time.perf_counter() - start
+
+        states[worker_count] = [
+            (cat.name, cat.energy, tuple(cat.world_position), [sensor.min_distance for sensor in cat.sensors.values()])
+            for cat in Cat.cat_instances
+        ]
+        print("    {} workers: {:.2f} s    {:,.0f} steps/s".format(worker_count, elapsed, simulation.steps / elapsed))
+
+        simulation.stop()
+
+    for worker_count, state in states.items():
+        assert state == states[worker_counts[0]], worker_count
+    print("    same results with {} workers".format(", ".join(str(count) for count in worker_counts)))
+
+
+if __name__ == '__main__':
+    benchmark_transforms()
+    benchmark_memory()
+    benchmark_brains()
+    check_compiled_networks()
+    benchmark_activations()
+    benchmark_loop_breaking()
+    benchmark_serialization()
+    benchmark_mutation()
+    check_patched_networks()
+    benchmark_speciation()
+    check_species_distances()
+    benchmark_islands()
+    benchmark_parallel_tick()
@@ -0,0 +1,430 @@
+import io
+import mmap
+import struct
+
+import numpy as np
+
+import activation_functions
+import genome
+import neural_network as nn
+from evolution import Brain, EvolutionOptions
+
+
+# Binary formats for networks, and for whole populations of brains (their
+# genotypes), meant to replace save_network/load_network. Both start with a
+# header containing a magic string and the format version.
+#
+# * Networks: header, string table, node table, connection table.
+# * Brain archives: header, one record per brain, string table shared by every
+#   brain, and an index table with the position and size of every record. A
+#   single brain can be read from an archive without reading the rest of it,
+#   and open_archive maps the file in memory, so opening an archive with
+#   millions of brains only reads the header, the string table and the index.
+#
+# Numbers are little endian. Keys (node ids, input names) can be ints or
+# strings, and are stored as (kind, value) pairs, where value is either the int
+# itself, or the position of the string in the string table. Activation
+# functions are stored by name, in the string table too, and looked up in a
+# functions_dict when loading, like load_network does.
+
+FORMAT_VERSION = 1
+
+NETWORK_MAGIC = b"ALNW"
+ARCHIVE_MAGIC = b"ALBA"
+
+KEY_INT = 0
+KEY_STRING = 1
+
+ROLE_INPUT = 0
+ROLE_OUTPUT = 1
+ROLE_HIDDEN = 2
+
+# Same values as genome.CONNECTION and genome.NODE
+GENE_CONNECTION = genome.CONNECTION
+GENE_NODE = genome.NODE
+
+# magic, version, node count, connection count
+network_header = struct.Struct("<4sHII")
+# magic, version, brain count, string table offset, index table offset
+archive_header = struct.Struct("<4sHQQQ")
+# input count, output count, gene count, global innovation counter, node
+# innovation counter, allow recurrency
+brain_header = struct.Struct("<IIIqq?")
+string_length = struct.Struct("<H")
+string_count = struct.Struct("<I")
+
+# Activation functions are string positions, or -1 for none
+node_dtype = np.dtype([("key_kind", "u1"), ("key", "<i8"), ("role", "u1"), ("function", "<i4")])
+connection_dtype = np.dtype([("source", "<u4"), ("target", "<u4"), ("weight", "<f8")])
+key_dtype = np.dtype([("kind", "u1"), ("value", "<i8")])
+output_dtype = np.dtype([("kind", "u1"), ("value", "<i8"), ("function", "<i4")])
+# Node genes store their key in the in_kind and in_key fields
+gene_dtype = np.dtype([
+    ("innovation", "<i8"),
+    ("type", "u1"),
+    ("enable", "u1"),
+    ("in_kind", "u1"),
+    ("in_key", "<i8"),
+    ("out_kind", "u1"),
+    ("out_key", "<i8"),
+    ("weight", "<f8"),
+    ("function", "<i4")
+])
+index_dtype = np.dtype([("offset", "<u8"), ("size", "<u8")])
+
+
+class StringTable:
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self.positions = {string: position for position, string in enumerate(self.strings)}
+
+    def add(self, string):
+        position = self.positions.get(string)
+        if position is None:
+            position = len(self.strings)
+            self.strings.append(string)
+            self.positions[string] = position
+
+        return position
+
+    def encode_key(self, key):
+        if isinstance(key, str):
+            return KEY_STRING, self.add(key)
+        return KEY_INT, key
+
+    def decode_key(self, kind, value):
+        if kind == KEY_STRING:
+            return self.strings[value]
+        return value
+
+    def encode_function(self, function):
+        if function is None:
+            return -1
+        return self.add(function.__name__)
+
+    def decode_function(self, position, functions_dict):
+        if position < 0:
+            return None
+        return functions_dict[self.strings[position]]
+
+    def to_bytes(self):
+        parts = [string_count.pack(len(self.strings))]
+        for string in self.strings:
+            encoded = string.encode("utf-8")
+            parts.append(string_length.pack(len(encoded)))
+            parts.append(encoded)
+
+        return b"".join(parts)
+
+    # Returns the table stored at offset, and the offset right after it
+    @staticmethod
+    def from_buffer(buffer, offset):
+        count = string_count.unpack_from(buffer, offset)[0]
+        offset += string_count.size
+
+        strings = []
+        for i in range(0, count):
+            length = string_length.unpack_from(buffer, offset)[0]
+            offset += string_length.size
+            strings.append(bytes(buffer[offset:offset + length]).decode("utf-8"))
+            offset += length
+
+        return StringTable(strings), offset
+
+
+def check_header(magic, version, expected_magic):
+    if magic != expected_magic:
+        raise ValueError("Not a {} file".format(expected_magic.decode()))
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported format version {}".format(version))
+
+
+# Networks
+
+def network_to_bytes(network):
+    strings = StringTable()
+    nodes = list(network.nodes.values())
+    positions = {node.id: position for position, node in enumerate(nodes)}
+
+    node_table = np.zeros(len(nodes), dtype=node_dtype)
+    connections = []
+    for position, node in enumerate(nodes):
+        if node.id in network.input_nodes_keys:
+            role = ROLE_INPUT
+        elif node.id in network.output_nodes_keys:
+            role = ROLE_OUTPUT
+        else:
+            role = ROLE_HIDDEN
+
+        key_kind, key = strings.encode_key(node.id)
+        node_table[position] = (key_kind, key, role, strings.encode_function(node.activation_function))
+
+        for input_node, weight in zip(node.inputs, node.conn_weights):
+            connections.append((positions[input_node.id], position, weight))
+
+    connection_table = np.array(connections, dtype=connection_dtype)
+
+    return b"".join([
+        network_header.pack(NETWORK_MAGIC, FORMAT_VERSION, len(node_table), len(connection_table)),
+        strings.to_bytes(),
+        node_table.tobytes(),
+        connection_table.tobytes()
+    ])
+
+
+def network_from_bytes(buffer, functions_dict=activation_functions.functions_by_name):
+    magic, version, node_count, connection_count = network_header.unpack_from(buffer, 0)
+    check_header(magic, version, NETWORK_MAGIC)
+
+    strings, offset = StringTable.from_buffer(buffer, network_header.size)
+    node_table = np.frombuffer(buffer, dtype=node_dtype, count=node_count, offset=offset)
+    offset += node_table.nbytes
+    connection_table = np.frombuffer(buffer, dtype=connection_dtype, count=connection_count, offset=offset)
+
+    network = nn.Network()
+    keys = []
+    for key_kind, key, role, function in node_table.tolist():
+        key = strings.decode_key(key_kind, key)
+        keys.append(key)
+
+        if role == ROLE_INPUT:
+            network.add_input_node(key)
+        elif role == ROLE_OUTPUT:
+            network.add_output_node(key, strings.decode_function(function, functions_dict))
+        else:
+            network.add_hidden_node(key, strings.decode_function(function, functions_dict))
+
+    for source, target, weight in connection_table.tolist():
+        network.add_connection(weight, keys[source], keys[target])
+
+    return network
+
+
+def save_network_binary(network, path):
+    f = open(path, "wb")
+    f.write(network_to_bytes(network))
+    f.close()
+
+
+def load_network_binary(path, functions_dict=activation_functions.functions_by_name):
+    f = open(path, "rb")
+    buffer = f.read()
+    f.close()
+
+    return network_from_bytes(buffer, functions_dict)
+
+
+# Brains
+
+def brain_to_bytes(brain, strings):
+    input_table = np.array([strings.encode_key(key) for key in brain.input_keys], dtype=key_dtype)
+    output_table = np.array(
+        [strings.encode_key(key) + (strings.encode_function(function),) for key, function in brain.output_nodes.items()],
+        dtype=output_dtype
+    )
+
+    genotype = brain.genotype
+    count = genotype.count
+    is_node = genotype.types[:count] == GENE_NODE
+
+    # Every node key and function is encoded once
+    encoded_keys = np.array([strings.encode_key(key) for key in genotype.node_keys], dtype=key_dtype).reshape(-1)
+    activation_ids = genotype.activation_ids[:count]
+    functions = np.full(count, -1, dtype=np.int32)
+    for activation_id in np.unique(activation_ids[activation_ids >= 0]).tolist():
+        functions[activation_ids == activation_id] = strings.encode_function(activation_functions.functions[activation_id])
+
+    in_keys = encoded_keys[genotype.in_nodes[:count]]
+    out_keys = encoded_keys[genotype.out_nodes[:count]]
+
+    gene_table = np.zeros(count, dtype=gene_dtype)
+    gene_table["innovation"] = genotype.innovations[:count]
+    gene_table["type"] = genotype.types[:count]
+    gene_table["enable"] = genotype.enabled[:count]
+    gene_table["in_kind"] = in_keys["kind"]
+    gene_table["in_key"] = in_keys["value"]
+    gene_table["out_kind"] = np.where(is_node, 0, out_keys["kind"])
+    gene_table["out_key"] = np.where(is_node, 0, out_keys["value"])
+    gene_table["weight"] = genotype.weights[:count]
+    gene_table["function"] = functions
+
+    return b"".join([
+        brain_header.pack(
+            len(input_table),
+            len(output_table),
+            len(gene_table),
+            brain.global_innov_counter,
+            brain.node_innov_counter,
+            brain.allow_recurrency
+        ),
+        input_table.tobytes(),
+        output_table.tobytes(),
+        gene_table.tobytes()
+    ])
+
+
+def brain_from_buffer(buffer, offset, strings, evolution_options, functions_dict):
+    input_count, output_count, gene_count, global_innov_counter, node_innov_counter, allow_recurrency = \
+        brain_header.unpack_from(buffer, offset)
+    offset += brain_header.size
+
+    input_table = np.frombuffer(buffer, dtype=key_dtype, count=input_count, offset=offset)
+    offset += input_table.nbytes
+    output_table = np.frombuffer(buffer, dtype=output_dtype, count=output_count, offset=offset)
+    offset += output_table.nbytes
+    gene_table = np.frombuffer(buffer, dtype=gene_dtype, count=gene_count, offset=offset)
+
+    brain = Brain(
+        input_keys=[strings.decode_key(kind, key) for kind, key in input_table.tolist()],
+        output_nodes={
+            strings.decode_key(kind, key): strings.decode_function(function, functions_dict)
+            for kind, key, function in output_table.tolist()
+        },
+        evolution_options=evolution_options
+    )
+
+    genotype = genome.Genome(max(gene_count, 1))
+    in_nodes = []
+    out_nodes = []
+    for gene_type, in_kind, in_key, out_kind, out_key in zip(
+            gene_table["type"].tolist(),
+            gene_table["in_kind"].tolist(),
+            gene_table["in_key"].tolist(),
+            gene_table["out_kind"].tolist(),
+            gene_table["out_key"].tolist()
+    ):
+        in_node = genotype.get_node_index(strings.decode_key(in_kind, in_key))
+        in_nodes.append(in_node)
+        if gene_type == GENE_CONNECTION:
+            out_nodes.append(genotype.get_node_index(strings.decode_key(out_kind, out_key)))
+        else:
+            out_nodes.append(in_node)
+
+    activation_ids = np.full(gene_count, -1, dtype=np.int32)
+    for function in np.unique(gene_table["function"][gene_table["function"] >= 0]).tolist():
+        activation_ids[gene_table["function"] == function] = activation_functions.get_function_id(
+            strings.decode_function(function, functions_dict)
+        )
+
+    genotype.count = gene_count
+    genotype.innovations[:gene_count] = gene_table["innovation"]
+    genotype.types[:gene_count] = gene_table["type"]
+    genotype.in_nodes[:gene_count] = in_nodes
+    genotype.out_nodes[:gene_count] = out_nodes
+    genotype.weights[:gene_count] = gene_table["weight"]
+    genotype.enabled[:gene_count] = gene_table["enable"]
+    genotype.activation_ids[:gene_count] = activation_ids
+    genotype.index_connections()
+
+    brain.genotype = genotype
+    brain.global_innov_counter = global_innov_counter
+    brain.node_innov_counter = node_innov_counter
+    brain.allow_recurrency = allow_recurrency
+
+    return brain
+
+
+# Writes brains one by one to a binary file object, so archives don't need to
+# fit in memory. The header is completed on close()
+class BrainArchiveWriter:
+
+    def __init__(self, file):
+        self.file = file
+        self.start = file.tell()
+        self.strings = StringTable()
+        self.index = []
+
+        self.file.write(archive_header.pack(ARCHIVE_MAGIC, FORMAT_VERSION, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, brain):
+        record = brain_to_bytes(brain, self.strings)
+        self.index.append((self.file.tell() - self.start, len(record)))
+        self.file.write(record)
+
+    def close(self):
+        strings_offset = self.file.tell() - self.start
+        self.file.write(self.strings.to_bytes())
+        index_offset = self.file.tell() - self.start
+        self.file.write(np.array(self.index, dtype=index_dtype).tobytes())
+        end = self.file.tell()
+
+        self.file.seek(self.start)
+        self.file.write(archive_header.pack(ARCHIVE_MAGIC, FORMAT_VERSION, len(self.index), strings_offset, index_offset))
+        self.file.seek(end)
+
+
+# Reads brains from an archive stored in buffer (bytes, or a memory map, see
+# open_archive)
+class BrainArchive:
+
+    def __init__(self, buffer, evolution_options=None, functions_dict=activation_functions.functions_by_name):
+        self.buffer = buffer
+        self.evolution_options = evolution_options if evolution_options is not None else EvolutionOptions()
+        self.functions_dict = functions_dict
+
+        magic, version, brain_count, strings_offset, index_offset = archive_header.unpack_from(buffer, 0)
+        check_header(magic, version, ARCHIVE_MAGIC)
+
+        self.strings = StringTable.from_buffer(buffer, strings_offset)[0]
+        self.index = np.frombuffer(buffer, dtype=index_dtype, count=brain_count, offset=index_offset)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, position):
+        return self.load_brain(position)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load_brain(self, position):
+        offset = int(self.index[position]["offset"])
+        return brain_from_buffer(self.buffer, offset, self.strings, self.evolution_options, self.functions_dict)
+
+    def close(self):
+        # Arrays pointing into the memory map need to be gone before closing it
+        self.index = None
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def save_population(brains, path):
+    f = open(path, "wb")
+    writer = BrainArchiveWriter(f)
+    for brain in brains:
+        writer.add(brain)
+    writer.close()
+    f.close()
+
+
+def open_archive(path, evolution_options=None, functions_dict=activation_functions.functions_by_name):
+    f = open(path, "rb")
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    f.close()
+
+    return BrainArchive(buffer, evolution_options, functions_dict)
+
+
+def population_to_bytes(brains):
+    f = io.BytesIO()
+    writer = BrainArchiveWriter(f)
+    for brain in brains:
+        writer.add(brain)
+    writer.close()
+
+    return f.getvalue()
+
+
+def population_from_bytes(buffer, evolution_options=None, functions_dict=activation_functions.functions_by_name):
+    archive = BrainArchive(buffer, evolution_options, functions_dict)
+    return [archive.load_brain(position) for position in range(0, len(archive))]
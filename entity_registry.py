@@ -0,0 +1,120 @@
+# Keeps track of every simulation object.
+#
+# * Every object gets a generational id. Ids pack a slot index and the
+#   generation of that slot, so an id that outlived its object (the slot was
+#   recycled) can be told apart from the new one.
+# * Objects are stored in one list per child depth, and removed by swapping
+#   them with the last item of that list, so removal doesn't depend on how many
+#   objects there are. Iterating the registry goes through the lists in depth
+#   order, so parents are processed before their children.
+# * Spawning and destroying objects while the registry is being iterated can be
+#   deferred with defer(), and applied later with flush().
+
+INDEX_BITS = 32
+INDEX_MASK = (1 << INDEX_BITS) - 1
+
+
+class EntityRegistry:
+
+    def __init__(self):
+        # slot index -> object using it (or None), and its current generation
+        self.entities = []
+        self.generations = []
+        self.free_indexes = []
+
+        # depth -> objects at that depth
+        self.layers = []
+
+        self.pending_actions = []
+
+    def __len__(self):
+        return sum(len(layer) for layer in self.layers)
+
+    # Iterates over a snapshot, so objects can be added or removed meanwhile.
+    # Objects removed before being reached are skipped
+    def __iter__(self):
+        for layer in list(self.layers):
+            for instance in list(layer):
+                if instance.entity_id is not None:
+                    yield instance
+
+    def add(self, instance, depth=0):
+        if self.free_indexes:
+            index = self.free_indexes.pop()
+        else:
+            index = len(self.entities)
+            self.entities.append(None)
+            self.generations.append(0)
+
+        self.entities[index] = instance
+        instance.entity_id = (self.generations[index] << INDEX_BITS) | index
+
+        instance.registry_depth = None
+        self.set_depth(instance, depth)
+
+        return instance.entity_id
+
+    def remove(self, instance):
+        index = instance.entity_id & INDEX_MASK
+
+        self.remove_from_layer(instance)
+
+        self.entities[index] = None
+        # Old ids pointing to this slot will no longer be valid
+        self.generations[index] += 1
+        self.free_indexes.append(index)
+
+        instance.entity_id = None
+
+    # Returns the object with the given id, or None if it no longer exists
+    def get(self, entity_id):
+        index = entity_id & INDEX_MASK
+        if index >= len(self.entities):
+            return None
+
+        if self.generations[index] != (entity_id >> INDEX_BITS):
+            return None
+
+        return self.entities[index]
+
+    def set_depth(self, instance, depth):
+        if instance.registry_depth == depth:
+            return
+
+        if instance.registry_depth is not None:
+            self.remove_from_layer(instance)
+
+        while len(self.layers) <= depth:
+            self.layers.append([])
+
+        layer = self.layers[depth]
+        instance.registry_depth = depth
+        instance.layer_index = len(layer)
+        layer.append(instance)
+
+    def remove_from_layer(self, instance):
+        layer = self.layers[instance.registry_depth]
+
+        # Swap with the last object of the layer, then drop the last item
+        last = layer[-1]
+        layer[instance.layer_index] = last
+        last.layer_index = instance.layer_index
+        layer.pop()
+
+        instance.registry_depth = None
+        instance.layer_index = None
+
+    # Queues a call to be run on the next flush
+    def defer(self, action, *args):
+        self.pending_actions.append((action, args))
+
+    # Runs the queued calls in the order they were queued. Calls queued while
+    # flushing are run as well
+    def flush(self):
+        index = 0
+        while index < len(self.pending_actions):
+            action, args = self.pending_actions[index]
+            action(*args)
+            index += 1
+
+        self.pending_actions = []
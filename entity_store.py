@@ -0,0 +1,150 @@
+import numpy as np
+
+
+# Structure of arrays storage for the state shared by every simulation object.
+# Each object gets a slot (a row index), and its position, rotation, world
+# transform and energy live in contiguous NumPy arrays instead of being
+# scattered around as Python lists and floats. Vectorized code can then work
+# directly on those arrays.
+# Slots of destroyed objects are recycled. Arrays are replaced by bigger ones
+# when the store runs out of slots, so references to them shouldn't be kept
+# between ticks.
+
+class EntityStore:
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.position = np.zeros((capacity, 2))
+        self.rotation = np.zeros(capacity)
+        self.world_position = np.zeros((capacity, 2))
+        self.world_rotation = np.zeros(capacity)
+        self.energy = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+        self.array_names = ["position", "rotation", "world_position", "world_rotation", "energy", "alive"]
+
+        self.free_slots = []
+        self.next_slot = 0
+
+    def grow(self):
+        new_capacity = self.capacity * 2
+        for name in self.array_names:
+            old_array = getattr(self, name)
+            new_array = np.zeros((new_capacity,) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, name, new_array)
+
+        self.capacity = new_capacity
+
+    def allocate(self):
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.next_slot >= self.capacity:
+                self.grow()
+            slot = self.next_slot
+            self.next_slot += 1
+
+        self.alive[slot] = True
+        return slot
+
+    def release(self, slot):
+        for name in self.array_names:
+            getattr(self, name)[slot] = 0
+        self.free_slots.append(slot)
+
+    # Moves the stored values of an object back into the object itself and
+    # frees its slot. The object can still be used afterwards, but it's no
+    # longer part of the store
+    def detach(self, instance):
+        names = get_stored_field_names(type(instance))
+        values = [getattr(instance, name) for name in names]
+
+        slot = instance.slot
+        instance.slot = None
+        for name, value in zip(names, values):
+            setattr(instance, name, value)
+
+        self.release(slot)
+
+    # Returns the slots currently in use, in ascending order
+    def get_live_slots(self):
+        return np.flatnonzero(self.alive[:self.next_slot])
+
+    # Returns a copy of every array, only including the live slots
+    def snapshot(self):
+        slots = self.get_live_slots()
+        arrays = {name: getattr(self, name)[slots] for name in self.array_names if name != "alive"}
+        arrays["slots"] = slots
+        return arrays
+
+
+# An attribute that lives in the object's EntityStore slot, if it has one, or
+# in the object itself otherwise. Vector attributes are read as lists.
+# The owner class needs an entity_store attribute, and its objects a slot
+# attribute (None when they are not in a store).
+#
+# Going through a descriptor makes every access slower, so classes keep plain
+# slots for these attributes, and only get StoredFields while a store is in use
+# (see install_stored_fields). A StoredField keeps the slot it replaces, which
+# holds the values of objects that are not in the store.
+
+class StoredField:
+
+    def __init__(self, array_name, vector=False, plain=None):
+        self.array_name = array_name
+        self.vector = vector
+        self.plain = plain
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        slot = instance.slot
+        if slot is None:
+            return self.plain.__get__(instance, owner)
+
+        value = getattr(instance.entity_store, self.array_name)[slot]
+        return value.tolist() if self.vector else value.item()
+
+    def __set__(self, instance, value):
+        slot = instance.slot
+        if slot is None:
+            self.plain.__set__(instance, value)
+        else:
+            getattr(instance.entity_store, self.array_name)[slot] = value
+
+
+# Classes list the attributes that can live in a store in a stored_fields dict
+# (attribute name -> (array name, vector)), and have a plain slot for each one.
+# These replace those slots with StoredFields, or put them back
+def install_stored_fields(cls):
+    for name, (array_name, vector) in vars(cls).get("stored_fields", dict()).items():
+        attribute = vars(cls)[name]
+        if not isinstance(attribute, StoredField):
+            setattr(cls, name, StoredField(array_name, vector, attribute))
+    stored_field_names_cache.clear()
+
+
+def remove_stored_fields(cls):
+    for name in vars(cls).get("stored_fields", dict()):
+        attribute = vars(cls)[name]
+        if isinstance(attribute, StoredField):
+            setattr(cls, name, attribute.plain)
+    stored_field_names_cache.clear()
+
+
+stored_field_names_cache = dict()
+
+
+def get_stored_field_names(cls):
+    names = stored_field_names_cache.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name, attribute in vars(klass).items():
+                if isinstance(attribute, StoredField) and name not in names:
+                    names.append(name)
+        stored_field_names_cache[cls] = names
+
+    return names
@@ -1,13 +1,21 @@
-import random
 from datetime import datetime
-from copy import deepcopy
 
+import numpy as np
+
+import activation_functions
 import neural_network as nn
+import random_streams
+from genome import Genome, CONNECTION, NODE
+from phenotype_cache import get_genotype_hash
 
 
 # Function that will return True with a probability of (probability * 100)%
-def chance(probability):
-    return random.random() < probability
+def chance(probability, stream=random_streams.default_stream):
+    return stream.random() < probability
+
+# Random pairs of nodes tried by Brain.random_new_connection before listing
+# every free pair (which takes time proportional to the number of pairs)
+max_pair_attempts = 32
 
 
 class EvolutionOptions:
@@ -33,58 +41,57 @@ class Brain:
         self.output_nodes = output_nodes
         self.evolution_options = evolution_options
 
-        self.genotype = dict()
+        # See genome.Genome
+        self.genotype = Genome()
         self.global_innov_counter = 0
         self.node_innov_counter = 0
 
         self.network = None
 
+        # Changes made to the genotype since the network was built, as
+        # (change, gene row) pairs. When all of them are weight or activation
+        # function changes, build_network patches a copy of the network instead
+        # of building a new one. None means changes are not being tracked
+        self.changelog = None
+
         # (Optional) To be set after instantiation
         self.allow_recurrency = False
 
-    def randomize_gene(self, gene):
-        gene_type = gene["type"]
-        if gene_type == "connection":
-            w = random.random() * self.evolution_options.weight_random_mutation_range
-            gene["weight"] = random.choice([w, -w])
-        elif gene_type == "node":
-            gene["activation_function"] = random.choice(self.evolution_options.activation_functions)
+        # (Optional) Class of the networks made by build_network. None means
+        # nn.CompiledNetwork. nn.GeneratedNetwork is faster for small networks
+        self.network_class = None
 
-    def mutate_genotype(self):
-        enabled_genes = [gene for gene in self.genotype.values() if gene["enable"] is True]
-        node_genes = [gene for gene in enabled_genes if gene["type"] == "node"]
-        connection_genes = [gene for gene in enabled_genes if gene["type"] == "connection"]
+        # (Optional) PhenotypeCache shared with other brains, so brains with
+        # the same enabled genes can share built networks
+        self.phenotype_cache = None
 
-        for node in node_genes:
-            if chance(self.evolution_options.gene_mutation_probability):
-                self.randomize_gene(gene=node)
+        # (Optional) RandomStream used for every random decision about this
+        # brain
+        self.rng = random_streams.default_stream
 
-        for connection in connection_genes:
-            if chance(self.evolution_options.gene_mutation_probability):
-                if chance(self.evolution_options.weight_perturbation_probability):
-                    # Perturbate weight
-                    max_value = self.evolution_options.weight_perturbation_max_delta
-                    perturbation_delta = random.uniform(0, max_value)
+    def log_change(self, change, row):
+        if self.changelog is not None:
+            self.changelog.append((change, row))
 
-                    connection["weight"] += random.choice([perturbation_delta, -perturbation_delta])
-                else:
-                    self.randomize_gene(gene=connection)
+    def randomize_gene(self, row):
+        genotype = self.genotype
+        gene_type = genotype.types[row]
+        if gene_type == CONNECTION:
+            w = self.rng.random() * self.evolution_options.weight_random_mutation_range
+            genotype.weights[row] = self.rng.choice([w, -w])
+        elif gene_type == NODE:
+            genotype.set_function(row, self.rng.choice(self.evolution_options.activation_functions))
 
-            if chance(self.evolution_options.connection_disable_probability):
-                connection["enable"] = False
+    def mutate_genotype(self):
+        mutate_brains([self])
 
     def randomize_genotype(self):
-        new_genotype = dict()
+        new_genotype = Genome()
 
         # Start minimally connected
         for o in self.output_nodes.keys():
-            i = random.choice(self.input_keys)
-            new_genotype[self.global_innov_counter] = {
-                "type": "connection",
-                "conn": [i, o],
-                "weight": 0,
-                "enable": True
-            }
+            i = self.rng.choice(self.input_keys)
+            new_genotype.add_connection(self.global_innov_counter, i, o, 0)
             self.global_innov_counter += 1
 
         # Assign the randomized genotype to the phenotype
@@ -94,190 +101,203 @@ class Brain:
         self.mutate_genotype()
 
     def disable_connections(self, connections):
-        connection_genes = [gene for gene in self.genotype.values() if gene["type"] == "connection"]
-
         for c in connections:
-            for g in connection_genes:
-                if g['conn'] == c:
-                    g['enable'] = False
-                    break
+            row = self.genotype.find_connection(c[0], c[1])
+            if row is not None:
+                self.genotype.enabled[row] = False
 
+    # Builds the phenotype, and returns it compiled (see nn.CompiledNetwork)
     def build_network(self):
-        self.network = nn.Network()
+        genotype_hash = None
+        if self.phenotype_cache is not None:
+            genotype_hash = get_genotype_hash(self)
+            cached = self.phenotype_cache.get(genotype_hash)
+            if cached is not None:
+                network, broken_connections = cached
+                # Same genes, so the same loops would have been broken
+                self.disable_connections(broken_connections)
+                self.network = network.copy()
+                self.changelog = []
+                return self.network
+
+        broken_connections = []
+        if self.network is not None and self.changelog is not None and \
+                all(change in ("weight", "function") for change, key in self.changelog):
+            self.patch_network()
+        else:
+            broken_connections = self.make_network()
+
+        if self.phenotype_cache is not None:
+            self.phenotype_cache.put(genotype_hash, self.network, broken_connections)
+
+        return self.network
+
+    # Builds the network from scratch. Returns the connections broken to
+    # avoid loops
+    def make_network(self):
+        network, broken_connections = self.make_network_graph()
+
+        self.network = network.compile(self.network_class)
+        self.changelog = []
+
+        return broken_connections
+
+    # The genotype as an nn.Network, before compiling it. Returns it along with
+    # the connections broken to avoid loops
+    def make_network_graph(self):
+        network = nn.Network()
 
         # Add the input and output nodes first
         for k in self.input_keys:
-            self.network.add_input_node(
+            network.add_input_node(
                 node_id=k,
             )
 
         for key, function in zip(self.output_nodes.keys(), self.output_nodes.values()):
-            self.network.add_output_node(
+            network.add_output_node(
                 node_id=key,
                 activation_function=function
             )
 
-        for gene in self.genotype.values():
-            if gene["enable"]:
-                gene_type = gene["type"]
-                if gene_type == "connection":
-                    # Both the input and output node need to exist in order to link them
-                    in_key = gene["conn"][0]
-                    out_key = gene["conn"][1]
-
-                    # The connection won't be created if any node on either side is missing.
-                    # This can happen if that node gene was disabled, or missing on the genotype.
-                    if in_key in self.network.nodes and out_key in self.network.nodes:
-                        self.network.add_connection(
-                            weight=gene["weight"],
-                            in_node_key=in_key,
-                            out_node_key=out_key
-                        )
-                elif gene_type == "node":
-                    self.network.add_hidden_node(node_id=gene["key"], activation_function=gene["activation_function"])
+        genotype = self.genotype
+        node_keys = genotype.node_keys
+        rows = genotype.get_rows(enabled=True)
+        for gene_type, in_node, out_node, weight, activation_id in zip(
+                genotype.types[rows].tolist(),
+                genotype.in_nodes[rows].tolist(),
+                genotype.out_nodes[rows].tolist(),
+                genotype.weights[rows].tolist(),
+                genotype.activation_ids[rows].tolist()
+        ):
+            if gene_type == CONNECTION:
+                # Both the input and output node need to exist in order to link them
+                in_key = node_keys[in_node]
+                out_key = node_keys[out_node]
+
+                # The connection won't be created if any node on either side is missing.
+                # This can happen if that node gene was disabled, or missing on the genotype.
+                if in_key in network.nodes and out_key in network.nodes:
+                    network.add_connection(
+                        weight=weight,
+                        in_node_key=in_key,
+                        out_node_key=out_key
+                    )
+            elif gene_type == NODE:
+                network.add_hidden_node(
+                    node_id=node_keys[out_node],
+                    activation_function=activation_functions.functions[activation_id]
+                )
 
         # Optional recurrency
+        broken_connections = []
         if not self.allow_recurrency:
-            for n in self.network.nodes.values():
-                broken_connections = nn.break_loops(n)
-                self.disable_connections(broken_connections)
+            broken_connections = nn.break_network_loops(network)
+            self.disable_connections(broken_connections)
+
+        return network, broken_connections
+
+    # Applies the changes in changelog to a copy of the network. Connection
+    # and node genes that didn't make it into the network are skipped, like
+    # build_network would do
+    def patch_network(self):
+        network = self.network.copy()
+
+        genotype = self.genotype
+        for change, row in self.changelog:
+            if change == "weight":
+                in_key, out_key = genotype.get_connection(row)
+                network.set_weight(in_key, out_key, genotype.weights.item(row))
+            elif change == "function":
+                network.set_activation_function(genotype.get_node_key(row), genotype.get_function(row))
+
+        self.network = network
+        self.changelog = []
+
+        return self.network
 
     def random_insert_node(self):
 
         # A node can only be inserted if there are existing connections. Avoid  that with a try-finally block
         try:
-            conn_keys = [k for k in self.genotype.keys() if self.genotype[k]["type"] == "connection"]
-            key = random.choice([k for k in conn_keys if self.genotype[k]["enable"] is True])
-            old_gene = self.genotype[key]
+            genotype = self.genotype
+            row = self.rng.choice(genotype.get_rows(CONNECTION, enabled=True))
+            old_in_key, old_out_key = genotype.get_connection(row)
 
             # New node
-            new_node = dict()
-            new_node_genotype_key = self.global_innov_counter
-            self.global_innov_counter += 1
-            new_node["type"] = "node"
-            new_node["key"] = self.node_innov_counter
+            new_node_key = self.node_innov_counter
             self.node_innov_counter += 1
-            new_node["activation_function"] = random.choice(self.evolution_options.activation_functions)
-            new_node["enable"] = True
+            new_node_row = genotype.add_node(
+                innovation=self.global_innov_counter,
+                key=new_node_key,
+                function=self.rng.choice(self.evolution_options.activation_functions)
+            )
+            self.global_innov_counter += 1
 
             # New connection leading into the new node
-            into_node = dict()
-            into_node_genotype_key = self.global_innov_counter
+            genotype.add_connection(self.global_innov_counter, old_in_key, new_node_key, 1)
             self.global_innov_counter += 1
-            into_node["type"] = "connection"
-            into_node["conn"] = []
-            into_node["conn"].append(old_gene["conn"][0])
-            into_node["conn"].append(new_node["key"])
-            into_node["weight"] = 1
-            into_node["enable"] = True
 
             # New connection leaving out of the new node
-            out_of_node = dict()
-            out_of_node_genotype_key = self.global_innov_counter
+            genotype.add_connection(self.global_innov_counter, new_node_key, old_out_key, genotype.weights.item(row))
             self.global_innov_counter += 1
-            out_of_node["type"] = "connection"
-            out_of_node["conn"] = []
-            out_of_node["conn"].append(new_node["key"])
-            out_of_node["conn"].append(old_gene["conn"][1])
-            out_of_node["weight"] = old_gene["weight"]
-            out_of_node["enable"] = True
-
-            # Disable old_gene
-            old_gene["enable"] = False
 
-            # append new genes to genome
-            self.genotype[new_node_genotype_key] = new_node
-            self.genotype[into_node_genotype_key] = into_node
-            self.genotype[out_of_node_genotype_key] = out_of_node
+            # Disable old gene
+            genotype.enabled[row] = False
+            self.log_change("disable", row)
+            self.log_change("insert", new_node_row)
 
         finally:
             pass
 
     def random_new_connection(self):
-
-        conn_list = [gene for gene in self.genotype.values() if gene["type"] == "connection"]
-
-        # Make a list of active node connections, to avoid duplicates
-        en_conn_list = [g["conn"] for g in conn_list if g["enable"] is True]
-
-        # Make a list of inactive node connections, to re-activate them instead of making a new one
-        dis_conn_list = [g["conn"] for g in conn_list if g["enable"] is False]
-
-        # Make a set of nodes that can be the input end of a connection (all nodes)
-        in_node_keys = set()
-        for g in conn_list:
-            in_node_keys.add(g['conn'][0])
-            in_node_keys.add(g['conn'][1])
-        in_node_keys.update(self.input_keys)
-        in_node_keys.difference_update(self.output_nodes.keys())
-
-        # Make a set of nodes that can be the output end of a connection (all nodes, except input nodes)
-        out_node_keys = set()
-        for g in conn_list:
-            out_node_keys.add(g['conn'][0])
-            out_node_keys.add(g['conn'][1])
-        out_node_keys.difference_update(self.input_keys)
-
-        # Turn in_node_keys and out_node_keys into lists
-        in_node_numbers = list(in_node_keys)
-        out_node_numbers = list(out_node_keys)
+        genotype = self.genotype
+        in_nodes, out_nodes = genotype.get_connectable_nodes(self.input_keys, self.output_nodes.keys())
+        if not in_nodes or not out_nodes:
+            return
 
         """
         Every node(M) can connect to any other non_input node(N). Non_input nodes are allowed to
-        connect to themselves. Random numbers following the former criteria are selected to be the
-        ends of new connections. M*N is used as the maximum number of allowed attempts, but
-        keeping in mind that pairs are randomly selected, there's no guarantee that every possible
-        pair will be tested.
+        connect to themselves. Random pairs are drawn until one of them is not connected yet, which
+        picks evenly between the free pairs. Each attempt is two draws and a dict lookup, so while
+        free pairs are plentiful this doesn't depend on the size of the genome. If that takes too many
+        attempts, most pairs are already connected, so the free ones are listed and one of them is
+        chosen. Listing them takes M x N lookups, which grows with the square of the number of nodes.
+        If there are none, there will be no new connection.
         """
-        # Initialize pair with None
-        pair = [None, None]
-        max_attempts = len(in_node_numbers) * len(out_node_numbers)
-
-        while True:
-
-            # Randomly chose an in_node and out_node
-            pair[0] = random.choice(in_node_numbers)
-            pair[1] = random.choice(out_node_numbers)
-
-            # Found an available pair. Exit the loop
-            if pair not in en_conn_list:
+        for attempt in range(0, max_pair_attempts):
+            pair = (self.rng.choice(in_nodes), self.rng.choice(out_nodes))
+            if not genotype.is_enabled_connection(*pair):
                 break
-
-            max_attempts -= 1
-            if max_attempts <= 0:
-                # Too many failed attempts. Return with no new connection
+        else:
+            free_pairs = [
+                (in_node, out_node) for in_node in in_nodes for out_node in out_nodes
+                if not genotype.is_enabled_connection(in_node, out_node)
+            ]
+            if not free_pairs:
                 return
+            pair = self.rng.choice(free_pairs)
 
-        if pair in dis_conn_list:
+        row = genotype.connection_rows.get(pair)
+        if row is not None:
             # Existing but disabled connection, re-enable it
-            gene = next((g for g in conn_list if g["conn"] == pair))
-            gene["enable"] = True
+            genotype.enabled[row] = True
+            self.log_change("enable", row)
 
         else:
-            # New connection, append it to genome
-            new_conn = dict()
-
-            new_conn_key = self.global_innov_counter
+            # New connection, append it to genome, and randomize its weight
+            row = genotype.add_gene(self.global_innov_counter, CONNECTION, pair[0], pair[1], 0, True, -1)
             self.global_innov_counter += 1
-            new_conn["type"] = "connection"
-            new_conn["conn"] = pair
-            new_conn["weight"] = 0
-            new_conn["enable"] = True
 
-            # Append new gene to genome
-            self.genotype[new_conn_key] = new_conn
-
-            # Randomize new gene weight
-            self.randomize_gene(
-                gene=self.genotype[new_conn_key]
-            )
+            self.randomize_gene(row)
+            self.log_change("connection", row)
 
-    def clone(self):
-        new_genotype = deepcopy(self.genotype)
+    # Same brain, with its own copy of the genotype
+    def copy(self):
+        new_genotype = self.genotype.copy()
 
         new_brain = Brain(
-            input_keys=deepcopy(self.input_keys),
-            output_nodes=deepcopy(self.output_nodes),
+            input_keys=list(self.input_keys),
+            output_nodes=dict(self.output_nodes),
             evolution_options=self.evolution_options
         )
 
@@ -286,13 +306,146 @@ class Brain:
         new_brain.node_innov_counter = self.node_innov_counter
 
         new_brain.allow_recurrency = self.allow_recurrency
+        new_brain.network_class = self.network_class
+        new_brain.phenotype_cache = self.phenotype_cache
+        new_brain.rng = self.rng
 
-        new_brain.mutate_genotype()
+        # Start from this brain's network, if it's up to date, so the new one
+        # can be patched instead of built from scratch
+        if self.changelog == []:
+            new_brain.network = self.network
+            new_brain.changelog = []
 
-        if chance(new_brain.evolution_options.node_insertion_chance):
+        return new_brain
+
+    # rng is the RandomStream of the new brain. By default it's the same one
+    # this brain uses
+    def clone(self, rng=None):
+        return clone_brains([self], None if rng is None else [rng])[0]
+
+
+# Mutates the genes of many genomes at once. Every decision (mutate, perturb or
+# randomize, disable, new function) takes one random number per gene, all of
+# them drawn together, and they are applied to the weights, enabled flags and
+# activation functions with masks. The probabilities are the same
+# Brain.mutate_genotype used to have gene by gene.
+# generators are the NumPy Generators each genome draws its numbers from (one
+# per genome), so a genome mutates the same way whatever other genomes are
+# mutated along with it. By default, they all use the default RandomStream.
+# Returns the changes made to every genome, as (change, gene row) pairs (see
+# Brain.changelog)
+def mutate_genomes(genomes, evolution_options, generators=None):
+
+    changes = [[] for genome in genomes]
+    counts = [genome.count for genome in genomes]
+    total = sum(counts)
+    if total == 0:
+        return changes
+
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    types = np.concatenate([genome.types[:genome.count] for genome in genomes])
+    enabled = np.concatenate([genome.enabled[:genome.count] for genome in genomes])
+    weights = np.concatenate([genome.weights[:genome.count] for genome in genomes])
+    activation_ids = np.concatenate([genome.activation_ids[:genome.count] for genome in genomes])
+
+    if generators is None:
+        draws = random_streams.default_stream.array.random((6, total))
+    else:
+        draws = np.concatenate(
+            [generator.random((6, genome.count)) for genome, generator in zip(genomes, generators)],
+            axis=1
+        )
+    mutated = draws[0] < evolution_options.gene_mutation_probability
+    perturbed = draws[1] < evolution_options.weight_perturbation_probability
+    # Both the perturbation delta and the new random weight are a magnitude
+    # with a random sign
+    signs = np.where(draws[3] < 0.5, 1.0, -1.0)
+    disabled = draws[4] < evolution_options.connection_disable_probability
+
+    nodes = enabled & (types == NODE)
+    connections = enabled & (types == CONNECTION)
+    mutated_nodes = nodes & mutated
+    mutated_connections = connections & mutated
+    perturbed_connections = mutated_connections & perturbed
+    randomized_connections = mutated_connections & ~perturbed
+    disabled_connections = connections & disabled
+
+    weights[perturbed_connections] += (
+        draws[2] * evolution_options.weight_perturbation_max_delta * signs
+    )[perturbed_connections]
+    weights[randomized_connections] = (
+        draws[2] * evolution_options.weight_random_mutation_range * signs
+    )[randomized_connections]
+    enabled[disabled_connections] = False
+
+    mutated_node_count = int(np.count_nonzero(mutated_nodes))
+    if mutated_node_count:
+        function_ids = np.array(
+            [activation_functions.get_function_id(f) for f in evolution_options.activation_functions],
+            dtype=np.int32
+        )
+        choices = np.minimum((draws[5] * len(function_ids)).astype(np.intp), len(function_ids) - 1)
+        activation_ids[mutated_nodes] = function_ids[choices[mutated_nodes]]
+
+    for genome, start, end in zip(genomes, starts.tolist(), ends.tolist()):
+        genome.weights[:genome.count] = weights[start:end]
+        genome.enabled[:genome.count] = enabled[start:end]
+        genome.activation_ids[:genome.count] = activation_ids[start:end]
+
+    # Only the changed genes are gone through one by one
+    positions = np.flatnonzero(mutated_nodes | mutated_connections | disabled_connections)
+    owners = np.searchsorted(ends, positions, side="right")
+    rows = positions - starts[owners]
+    for owner, row, node, weight, disable in zip(
+            owners.tolist(),
+            rows.tolist(),
+            mutated_nodes[positions].tolist(),
+            mutated_connections[positions].tolist(),
+            disabled_connections[positions].tolist()
+    ):
+        if node:
+            changes[owner].append(("function", row))
+        if weight:
+            changes[owner].append(("weight", row))
+        if disable:
+            changes[owner].append(("disable", row))
+
+    return changes
+
+
+# Mutates the genotypes of several brains at once. All of them must share the
+# same evolution options
+def mutate_brains(brains):
+    if not brains:
+        return
+
+    changes = mutate_genomes(
+        [brain.genotype for brain in brains],
+        brains[0].evolution_options,
+        [brain.rng.array for brain in brains]
+    )
+    for brain, brain_changes in zip(brains, changes):
+        for change, row in brain_changes:
+            brain.log_change(change, row)
+
+
+# Mutated copies of several brains (like Brain.clone), with the gene mutations
+# of all of them made at once. rngs are the RandomStreams of the new brains, if
+# they shouldn't use the same ones as the brains they come from
+def clone_brains(brains, rngs=None):
+    new_brains = [brain.copy() for brain in brains]
+    if rngs is not None:
+        for new_brain, rng in zip(new_brains, rngs):
+            new_brain.rng = rng
+
+    mutate_brains(new_brains)
+
+    for new_brain in new_brains:
+        if chance(new_brain.evolution_options.node_insertion_chance, new_brain.rng):
             new_brain.random_insert_node()
 
-        if chance(self.evolution_options.new_connection_chance):
+        if chance(new_brain.evolution_options.new_connection_chance, new_brain.rng):
             new_brain.random_new_connection()
 
-        return new_brain
+    return new_brains
@@ -0,0 +1,257 @@
+import numpy as np
+
+import activation_functions
+
+
+CONNECTION = 0
+NODE = 1
+
+
+# A genotype stored as parallel NumPy arrays, one row per gene, in the order
+# genes were added. It replaces the old dict of dicts, where every gene was a
+# dict like {"type": "connection", "conn": [in, out], "weight": w,
+# "enable": True}, so copying a genome takes a few buffer copies instead of a
+# deepcopy.
+#
+# * innovations: innovation number of the gene (its key in the old dict)
+# * types: CONNECTION or NODE
+# * in_nodes, out_nodes: node indexes for connection genes. Node genes store
+#   their own node index in both
+# * weights: connection weights, 0 for node genes
+# * enabled: whether the gene is expressed in the network
+# * activation_ids: activation function id of node genes (see
+#   activation_functions), -1 for connection genes
+#
+# Node keys (input names, output names and hidden node numbers) are kept in
+# node_keys, and genes refer to them by their index in it. Rows are never
+# removed, so row numbers can be used to refer to genes.
+#
+# Connection genes are also indexed by their (in node, out node) pair, and the
+# nodes that can start and end new connections are kept in lists, so
+# Brain.random_new_connection doesn't need to go through the whole genome.
+
+class Genome:
+
+    array_names = ("innovations", "types", "in_nodes", "out_nodes", "weights", "enabled", "activation_ids")
+
+    def __init__(self, capacity=16):
+        self.count = 0
+        self.innovations = np.zeros(capacity, dtype=np.int64)
+        self.types = np.zeros(capacity, dtype=np.uint8)
+        self.in_nodes = np.zeros(capacity, dtype=np.int32)
+        self.out_nodes = np.zeros(capacity, dtype=np.int32)
+        self.weights = np.zeros(capacity)
+        self.enabled = np.zeros(capacity, dtype=bool)
+        self.activation_ids = np.full(capacity, -1, dtype=np.int32)
+
+        self.node_keys = []
+        self.node_indexes = dict()
+
+        # (in node, out node) -> row of the connection gene between them
+        self.connection_rows = dict()
+        # Nodes at either end of any connection gene, in the order they first
+        # appeared
+        self.connected_nodes = []
+        self.connected_node_set = set()
+
+        # See get_connectable_nodes
+        self.source_nodes = None
+        self.target_nodes = None
+        self.role_input_nodes = None
+        self.role_output_nodes = None
+        self.classified_nodes = 0
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, size):
+        capacity = len(self.innovations)
+        if size <= capacity:
+            return
+
+        new_capacity = max(size, capacity * 2, 16)
+        for name in self.array_names:
+            old_array = getattr(self, name)
+            new_array = np.zeros(new_capacity, dtype=old_array.dtype)
+            new_array[:self.count] = old_array[:self.count]
+            setattr(self, name, new_array)
+        self.activation_ids[self.count:] = -1
+
+    # Index of a node key in node_keys. Keys seen for the first time are added
+    def get_node_index(self, key):
+        index = self.node_indexes.get(key)
+        if index is None:
+            index = len(self.node_keys)
+            self.node_keys.append(key)
+            self.node_indexes[key] = index
+
+        return index
+
+    def add_gene(self, innovation, gene_type, in_node, out_node, weight, enabled, activation_id):
+        self.grow(self.count + 1)
+
+        row = self.count
+        self.innovations[row] = innovation
+        self.types[row] = gene_type
+        self.in_nodes[row] = in_node
+        self.out_nodes[row] = out_node
+        self.weights[row] = weight
+        self.enabled[row] = enabled
+        self.activation_ids[row] = activation_id
+        self.count += 1
+
+        if gene_type == CONNECTION:
+            self.index_connection(row, in_node, out_node)
+
+        return row
+
+    def index_connection(self, row, in_node, out_node):
+        self.connection_rows.setdefault((in_node, out_node), row)
+        for node in (in_node, out_node):
+            if node not in self.connected_node_set:
+                self.connected_node_set.add(node)
+                self.connected_nodes.append(node)
+
+    # Rebuilds the connection index, for genomes whose arrays were filled
+    # directly instead of through add_gene
+    def index_connections(self):
+        self.connection_rows = dict()
+        self.connected_nodes = []
+        self.connected_node_set = set()
+        self.source_nodes = None
+
+        rows = self.get_rows(CONNECTION)
+        for row, in_node, out_node in zip(rows, self.in_nodes[rows].tolist(), self.out_nodes[rows].tolist()):
+            self.index_connection(row, in_node, out_node)
+
+    # Both add_ methods return the row of the new gene
+    def add_connection(self, innovation, in_key, out_key, weight, enabled=True):
+        return self.add_gene(
+            innovation, CONNECTION, self.get_node_index(in_key), self.get_node_index(out_key), weight, enabled, -1
+        )
+
+    def add_node(self, innovation, key, function, enabled=True):
+        node = self.get_node_index(key)
+        return self.add_gene(innovation, NODE, node, node, 0, enabled, activation_functions.get_function_id(function))
+
+    def copy(self):
+        genome = Genome.__new__(Genome)
+        genome.count = self.count
+        for name in self.array_names:
+            setattr(genome, name, getattr(self, name)[:self.count].copy())
+        genome.node_keys = list(self.node_keys)
+        genome.node_indexes = dict(self.node_indexes)
+
+        genome.connection_rows = dict(self.connection_rows)
+        genome.connected_nodes = list(self.connected_nodes)
+        genome.connected_node_set = set(self.connected_node_set)
+
+        genome.source_nodes = None
+        genome.target_nodes = None
+        if self.source_nodes is not None:
+            genome.source_nodes = list(self.source_nodes)
+            genome.target_nodes = list(self.target_nodes)
+        # These never change, so they can be shared
+        genome.role_input_nodes = self.role_input_nodes
+        genome.role_output_nodes = self.role_output_nodes
+        genome.classified_nodes = self.classified_nodes
+
+        return genome
+
+    # Rows of genes, in order, optionally only the ones of a given type and/or
+    # enabled state
+    def get_rows(self, gene_type=None, enabled=None):
+        mask = np.ones(self.count, dtype=bool)
+        if gene_type is not None:
+            mask &= self.types[:self.count] == gene_type
+        if enabled is not None:
+            mask &= self.enabled[:self.count] == enabled
+
+        return np.flatnonzero(mask).tolist()
+
+    def count_enabled(self):
+        return int(np.count_nonzero(self.enabled[:self.count]))
+
+    # [in key, out key] of a connection gene
+    def get_connection(self, row):
+        return [self.node_keys[self.in_nodes[row]], self.node_keys[self.out_nodes[row]]]
+
+    # Key of a node gene
+    def get_node_key(self, row):
+        return self.node_keys[self.out_nodes[row]]
+
+    def get_function(self, row):
+        return activation_functions.functions[self.activation_ids[row]]
+
+    def set_function(self, row, function):
+        self.activation_ids[row] = activation_functions.get_function_id(function)
+
+    # Row of the first connection gene between two nodes, or None
+    def find_connection(self, in_key, out_key):
+        in_node = self.node_indexes.get(in_key)
+        out_node = self.node_indexes.get(out_key)
+        if in_node is None or out_node is None:
+            return None
+
+        return self.connection_rows.get((in_node, out_node))
+
+    # Nodes that can be the input end of a new connection (input nodes and
+    # connected nodes, except output nodes), and nodes that can be the output
+    # end (connected nodes, except input nodes), as two lists of node indexes.
+    # Only nodes connected since the last call are classified, so the lists
+    # are returned as they are kept, and must not be changed.
+    # A genome is expected to always be given the same input and output keys
+    def get_connectable_nodes(self, input_keys, output_keys):
+        if self.source_nodes is None:
+            self.role_input_nodes = set(self.get_node_index(key) for key in input_keys)
+            self.role_output_nodes = set(self.get_node_index(key) for key in output_keys)
+            self.source_nodes = [
+                self.node_indexes[key] for key in input_keys if self.node_indexes[key] not in self.role_output_nodes
+            ]
+            self.target_nodes = []
+            self.classified_nodes = 0
+
+        for node in self.connected_nodes[self.classified_nodes:]:
+            if node not in self.role_input_nodes:
+                self.target_nodes.append(node)
+                if node not in self.role_output_nodes:
+                    self.source_nodes.append(node)
+        self.classified_nodes = len(self.connected_nodes)
+
+        return self.source_nodes, self.target_nodes
+
+    def is_enabled_connection(self, in_node, out_node):
+        row = self.connection_rows.get((in_node, out_node))
+        return row is not None and bool(self.enabled[row])
+
+    # A gene in the old dict format
+    def get_gene(self, row):
+        if self.types[row] == CONNECTION:
+            return {
+                "type": "connection",
+                "conn": self.get_connection(row),
+                "weight": self.weights.item(row),
+                "enable": bool(self.enabled[row])
+            }
+
+        return {
+            "type": "node",
+            "key": self.get_node_key(row),
+            "activation_function": self.get_function(row),
+            "enable": bool(self.enabled[row])
+        }
+
+    # The whole genome in the old dict of dicts format, by innovation number
+    def to_dict(self):
+        return {self.innovations.item(row): self.get_gene(row) for row in range(0, self.count)}
+
+    @staticmethod
+    def from_dict(genotype):
+        genome = Genome(max(len(genotype), 1))
+        for innovation, gene in genotype.items():
+            if gene["type"] == "connection":
+                genome.add_connection(innovation, gene["conn"][0], gene["conn"][1], gene["weight"], gene["enable"])
+            else:
+                genome.add_node(innovation, gene["key"], gene["activation_function"], gene["enable"])
+
+        return genome
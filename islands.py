@@ -0,0 +1,230 @@
+import multiprocessing
+import os
+import time
+
+import brain_archive
+import metrics
+from random_streams import RandomStream
+from simulation import Simulation, Cat, Burger, int_to_hms_string
+
+
+# Island model evolution: several independent worlds, each one in its own
+# process, that trade their best cats every now and then.
+#
+# Every island is a Simulation with its own seed, running in a worker process
+# (simulation objects live in class attributes, so a process can only run one
+# simulation at a time). Islands run migration_period simulated seconds at a
+# time, all at once. Then every island sends the genotypes of its
+# migration_size best cats (by burger rate) to the next island, in a ring, as
+# a brain archive (see brain_archive.population_to_bytes). Immigrants show up
+# in random places of their new island, with their brains unchanged.
+#
+# With the same seed, settings and number of islands, runs always go the same
+# way, however many cores there are.
+
+
+# Runs in the worker process of an island. Waits for (seconds, immigrants)
+# commands, and answers each one with a report (see get_island_report).
+# "population" is answered with every cat of the island (see
+# get_island_population). None stops it
+def run_island(connection, index, seed, settings, migration_size):
+    # Forked workers start with a copy of the metrics of the main process
+    metrics.reset()
+
+    simulation = Simulation()
+    for name, value in settings.items():
+        setattr(simulation, name, value)
+    simulation.world_seed = seed
+    simulation.start()
+
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        if command == "population":
+            connection.send(get_island_population())
+            continue
+
+        seconds, immigrants = command
+        if immigrants is not None:
+            for brain in brain_archive.population_from_bytes(immigrants, simulation.evolution_options):
+                simulation.spawn_cat(brain)
+
+        start = time.perf_counter()
+        steps = simulation.steps
+        simulation.run(seconds)
+        connection.send(get_island_report(
+            simulation, index, migration_size, simulation.steps - steps, time.perf_counter() - start
+        ))
+
+    connection.close()
+
+
+def get_island_report(simulation, index, migration_size, steps, seconds):
+    cats = sorted(Cat.cat_instances, key=lambda cat: cat.burger_rate, reverse=True)
+
+    return {
+        "island": index,
+        "time": simulation.time,
+        "cats": len(cats),
+        "burgers": len(Burger.burger_instances),
+        "best_burger_rate": cats[0].burger_rate if cats else 0,
+        # Simulation steps per real second, since the last report
+        "steps_per_second": steps / seconds if seconds > 0 else 0,
+        "counters": dict(metrics.counters),
+        "gauges": dict(metrics.gauges),
+        "emigrants": brain_archive.population_to_bytes([cat.brain for cat in cats[:migration_size]]),
+    }
+
+
+# Every cat of an island, in order: their (name, energy) pairs, and their
+# genotypes as a brain archive. Enough to tell whether two runs went the same
+# way
+def get_island_population():
+    cats = list(Cat.cat_instances)
+
+    return {
+        "cats": [(cat.name, cat.energy) for cat in cats],
+        "genotypes": brain_archive.population_to_bytes([cat.brain for cat in cats]),
+    }
+
+
+class IslandRunner:
+
+    # seed can be any int, or None to pick a random one. settings are
+    # Simulation attributes to set on every island, by name
+    def __init__(self, island_count, seed=None, settings=None, migration_period=60, migration_size=2):
+        self.island_count = island_count
+        self.migration_period = migration_period
+        self.migration_size = migration_size
+        self.settings = dict(settings or dict())
+
+        seed_stream = RandomStream(seed)
+        self.seeds = [seed_stream.child(index).getrandbits(64) for index in range(0, island_count)]
+
+        self.processes = []
+        self.connections = []
+
+        # Simulated seconds every island ran, and the brain archives each one
+        # will get on the next run
+        self.time = 0
+        self.migrations = 0
+        self.immigrants = [None] * island_count
+        # Last report of every island (see get_island_report)
+        self.reports = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        for index, seed in enumerate(self.seeds):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_island,
+                args=(worker_connection, index, seed, self.settings, self.migration_size),
+                daemon=True
+            )
+            process.start()
+            worker_connection.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+    def stop(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+
+        self.processes = []
+        self.connections = []
+
+    # Runs every island for migration_period seconds and moves the best cats
+    # around. Returns the progress (see get_progress)
+    def run_period(self):
+        for connection, immigrants in zip(self.connections, self.immigrants):
+            connection.send((self.migration_period, immigrants))
+        self.reports = [connection.recv() for connection in self.connections]
+        self.time += self.migration_period
+
+        # Every island sends its best cats to the next one
+        if self.island_count > 1:
+            self.immigrants = [self.reports[index - 1]["emigrants"] for index in range(0, self.island_count)]
+            self.migrations += 1
+
+        return self.get_progress()
+
+    # Runs every island for some simulated seconds (rounded to migration
+    # periods). progress_callback gets the progress after every period
+    def run(self, seconds, progress_callback=None):
+        for i in range(0, max(1, round(seconds / self.migration_period))):
+            progress = self.run_period()
+            if progress_callback is not None:
+                progress_callback(progress)
+
+    # Every cat of every island (see get_island_population)
+    def get_populations(self):
+        for connection in self.connections:
+            connection.send("population")
+        return [connection.recv() for connection in self.connections]
+
+    # How every island is doing, and all of them together. Metrics from every
+    # island are added up (gauges too, which works for most of them, like
+    # species.count or phenotype_cache.bytes). Per island values are in
+    # "islands"
+    def get_progress(self):
+        totals = dict()
+        for report in self.reports:
+            for values in (report["counters"], report["gauges"]):
+                for name, value in values.items():
+                    totals[name] = totals.get(name, 0) + value
+
+        return {
+            "time": self.time,
+            "migrations": self.migrations,
+            "cats": sum(report["cats"] for report in self.reports),
+            "burgers": sum(report["burgers"] for report in self.reports),
+            "best_burger_rate": max((report["best_burger_rate"] for report in self.reports), default=0),
+            "steps_per_second": sum(report["steps_per_second"] for report in self.reports),
+            "metrics": totals,
+            "islands": [
+                {name: value for name, value in report.items() if name != "emigrants"}
+                for report in self.reports
+            ],
+        }
+
+
+def format_progress(progress):
+    lines = list()
+    lines.append("{} simulated, {} migrations: {} cats, {} species, best burger rate {} ({:,.0f} steps/s)".format(
+        int_to_hms_string(int(progress["time"])),
+        progress["migrations"],
+        progress["cats"],
+        progress["metrics"].get("species.count", 0),
+        progress["best_burger_rate"],
+        progress["steps_per_second"]
+    ))
+    for island in progress["islands"]:
+        lines.append("    island {}: {} cats, {} species, best burger rate {}".format(
+            island["island"],
+            island["cats"],
+            island["gauges"].get("species.count", 0),
+            island["best_burger_rate"]
+        ))
+
+    return "\n".join(lines)
+
+
+# One island per core, printing how they're doing after every migration
+if __name__ == '__main__':
+    with IslandRunner(os.cpu_count()) as runner:
+        while True:
+            print(format_progress(runner.run_period()))
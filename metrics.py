@@ -0,0 +1,35 @@
+# Numbers the simulation reports about itself, like cache hits or how long
+# things take. Counters only go up, gauges hold the last value set.
+# Everything is stored by name, in plain dicts, so any module can report
+# things without setting anything up first
+
+counters = dict()
+gauges = dict()
+
+
+def increment(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    gauges[name] = value
+
+
+def get_counter(name):
+    return counters.get(name, 0)
+
+
+def get_gauge(name, default=None):
+    return gauges.get(name, default)
+
+
+# Returns a copy of every counter and gauge, by name
+def snapshot():
+    values = dict(counters)
+    values.update(gauges)
+    return values
+
+
+def reset():
+    counters.clear()
+    gauges.clear()
@@ -1,7 +1,14 @@
 import ast
+import copy
+
+import numpy as np
+
+import activation_functions
 
 
 class Node:
+    # Brains have lots of nodes, so they don't get a __dict__ to save memory
+    __slots__ = ("output", "inputs", "conn_weights", "input_values", "id", "activation_function", "dependant_nodes")
 
     def __init__(self):
         self.output = 0
@@ -90,6 +97,107 @@ def break_loops(node):
     return broken_connections
 
 
+# Finds the strongly connected components among nodes (Tarjan's algorithm,
+# without recursion so deep networks don't hit the recursion limit). Only
+# connections between the given nodes are followed.
+# Returns a list of components, each one a list of nodes
+def get_strongly_connected_components(nodes):
+    members = set(nodes)
+    indexes = dict()
+    low_links = dict()
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in nodes:
+        if root in indexes:
+            continue
+
+        indexes[root] = low_links[root] = len(indexes)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(root.dependant_nodes))]
+
+        while work:
+            node, dependant_nodes = work[-1]
+
+            for dependant in dependant_nodes:
+                if dependant not in members:
+                    continue
+                if dependant not in indexes:
+                    # Go deeper, and come back to this node later
+                    indexes[dependant] = low_links[dependant] = len(indexes)
+                    stack.append(dependant)
+                    on_stack.add(dependant)
+                    work.append((dependant, iter(dependant.dependant_nodes)))
+                    break
+                if dependant in on_stack:
+                    low_links[node] = min(low_links[node], indexes[dependant])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_links[parent] = min(low_links[parent], low_links[node])
+
+                if low_links[node] == indexes[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+# Does the same as calling break_loops on every node of the network, in order,
+# and returns the same broken connections, but without going through every
+# possible path.
+# When break_loops gets to a node, the connections it breaks are the ones coming
+# from nodes in the same loop (strongly connected component), ignoring nodes it
+# already went through. So for every component with loops, its first node loses
+# every input coming from the component, and the rest of the component is split
+# again into components.
+# Networks without loops take a single pass. Each of those splits goes through
+# the rest of the component again, so the worst case (everything connected to
+# everything) is O(V * (V + E)), but the usual case is close to O(V + E)
+def break_network_loops(network):
+    order = list(network.nodes.values())
+    positions = {node: position for position, node in enumerate(order)}
+
+    loop_inputs = dict()
+    pending = get_strongly_connected_components(order)
+    while pending:
+        component = pending.pop()
+        if len(component) == 1 and component[0] not in component[0].inputs:
+            continue
+
+        component.sort(key=positions.get)
+        first = component[0]
+        members = set(component)
+        loop_inputs[first] = [index for index, n in enumerate(first.inputs) if n in members]
+
+        pending.extend(get_strongly_connected_components(component[1:]))
+
+    broken_connections = []
+    for node in order:
+        delete_indexes = loop_inputs.get(node)
+        if not delete_indexes:
+            continue
+
+        # Same as in break_loops
+        delete_indexes.reverse()
+        for i in delete_indexes:
+            node.inputs[i].dependant_nodes.remove(node)
+            broken_connections.append([node.inputs[i].id, node.id])
+            del(node.inputs[i])
+            del(node.conn_weights[i])
+
+    return broken_connections
+
+
 class Network:
 
     def __init__(self):
@@ -159,6 +267,345 @@ class Network:
         for n in self.nodes.values():
             n.output = 0
 
+    # Returns the node keys, sorted so every node comes after the nodes feeding
+    # it. Nodes that are part of a loop can't be sorted, so they go last, in
+    # the order they were added
+    def get_topological_order(self):
+        pending_inputs = {key: len(node.inputs) for key, node in self.nodes.items()}
+        ready = [key for key, count in pending_inputs.items() if count == 0]
+
+        order = []
+        index = 0
+        while index < len(ready):
+            key = ready[index]
+            index += 1
+            order.append(key)
+
+            for dependant in self.nodes[key].dependant_nodes:
+                pending_inputs[dependant.id] -= 1
+                if pending_inputs[dependant.id] == 0:
+                    ready.append(dependant.id)
+
+        sorted_keys = set(order)
+        order.extend(key for key in self.nodes if key not in sorted_keys)
+
+        return order
+
+    # Turns the network into a CompiledNetwork (or a subclass of it, like
+    # GeneratedNetwork), which works the same way, but much faster
+    def compile(self, network_class=None):
+        if network_class is None:
+            network_class = CompiledNetwork
+
+        node_keys = self.get_topological_order()
+        positions = {key: position for position, key in enumerate(node_keys)}
+
+        computed_nodes = []
+        segment_starts = []
+        sources = []
+        weights = []
+        activation_ids = []
+
+        for key in node_keys:
+            node = self.nodes[key]
+            # Just like in Node.activate, nodes without inputs keep their output
+            if node.conn_weights == []:
+                continue
+
+            computed_nodes.append(positions[key])
+            segment_starts.append(len(sources))
+            sources.extend(positions[input_node.id] for input_node in node.inputs)
+            weights.extend(node.conn_weights)
+
+            activation_ids.append(activation_functions.get_function_id(node.activation_function))
+
+        return network_class(
+            node_keys=node_keys,
+            input_positions=[positions[key] for key in self.input_nodes_keys],
+            output_positions=[positions[key] for key in self.output_nodes_keys],
+            computed_nodes=computed_nodes,
+            segment_starts=segment_starts,
+            sources=sources,
+            weights=weights,
+            activation_ids=activation_ids
+        )
+
+
+# A Network flattened into arrays, in CSR style: every computed node (the ones
+# with inputs) owns a contiguous segment of the sources and weights arrays,
+# starting at its segment_starts entry. Nodes are identified by their position
+# in node_keys, which follows topological order when possible.
+# Its interface matches the one of Network, and so does its behaviour: every
+# node sees the outputs other nodes had before the present step, so loops work
+# as one step delays. activate() doesn't allocate any memory.
+# Weights and activation functions can be changed after compiling, with
+# set_weight and set_activation_function.
+
+class CompiledNetwork:
+
+    def __init__(self, node_keys, input_positions, output_positions, computed_nodes, segment_starts, sources, weights,
+                 activation_ids):
+        self.node_keys = list(node_keys)
+        self.input_nodes_keys = [self.node_keys[position] for position in input_positions]
+        self.output_nodes_keys = [self.node_keys[position] for position in output_positions]
+        self.input_positions = list(input_positions)
+        self.output_positions = list(output_positions)
+
+        self.computed_nodes = np.array(computed_nodes, dtype=np.intp)
+        self.segment_starts = np.array(segment_starts, dtype=np.intp)
+        self.sources = np.array(sources, dtype=np.intp)
+        self.weights = np.array(weights, dtype=float)
+
+        # Activation functions are referenced by their id in
+        # activation_functions.functions
+        self.activation_ids = np.array(activation_ids, dtype=np.intp)
+
+        # (input node key, output node key) -> position in sources and weights
+        self.connection_positions = dict()
+        for node_position, start, end in zip(
+                self.computed_nodes.tolist(),
+                self.segment_starts.tolist(),
+                self.segment_starts.tolist()[1:] + [len(self.sources)]
+        ):
+            for position in range(start, end):
+                key = (self.node_keys[self.sources.item(position)], self.node_keys[node_position])
+                self.connection_positions[key] = position
+
+        # Node outputs
+        self.state = np.zeros(len(self.node_keys))
+
+        self.prepare_evaluation()
+
+    # Builds the arrays used by activate().
+    # Node.activate adds up inputs one by one, in order. To get exactly the
+    # same results, connections are evaluated "by rank": first the first input
+    # of every node, then the second one, and so on. Computed nodes are sorted
+    # by input count, so the nodes having a given rank are always a prefix of
+    # the sums buffer.
+    def prepare_evaluation(self):
+        input_counts = np.diff(np.append(self.segment_starts, len(self.sources)))
+        by_input_count = np.argsort(-input_counts, kind="stable")
+        sorted_counts = input_counts[by_input_count]
+        sorted_starts = self.segment_starts[by_input_count]
+
+        rank_sizes = []
+        rank_order = []
+        for rank in range(0, int(sorted_counts[0]) if len(sorted_counts) else 0):
+            size = int(np.count_nonzero(sorted_counts > rank))
+            rank_sizes.append(size)
+            rank_order.append(sorted_starts[:size] + rank)
+
+        self.rank_sizes = rank_sizes
+        self.rank_order = np.concatenate(rank_order) if rank_order else np.zeros(0, dtype=np.intp)
+        # Connection position -> position in rank_order
+        self.rank_positions = np.argsort(self.rank_order)
+        self.rank_sources = self.sources[self.rank_order]
+        self.rank_weights = self.weights[self.rank_order]
+        self.evaluation_nodes = self.computed_nodes[by_input_count].tolist()
+        self.evaluation_functions = [activation_functions.functions[i] for i in self.activation_ids[by_input_count]]
+
+        self.prepare_buffers()
+
+    def prepare_buffers(self):
+        # Scratch buffers. gathered holds a copy of the outputs feeding every
+        # connection, taken before any node is updated, so it acts as the
+        # previous state buffer
+        self.gathered = np.zeros(len(self.rank_order))
+        self.sums = np.zeros(len(self.computed_nodes))
+
+        # Views used to add every rank after the first one
+        self.rank_views = []
+        offset = self.rank_sizes[0] if self.rank_sizes else 0
+        for size in self.rank_sizes[1:]:
+            self.rank_views.append((self.sums[:size], self.gathered[offset:offset + size]))
+            offset += size
+        self.first_rank = self.gathered[:len(self.sums)]
+
+    # Returns a copy with its own weights, activation functions and state. The
+    # structure never changes after compiling, so it's shared
+    def copy(self):
+        network = copy.copy(self)
+        network.weights = self.weights.copy()
+        network.rank_weights = self.rank_weights.copy()
+        network.activation_ids = self.activation_ids.copy()
+        network.evaluation_functions = list(self.evaluation_functions)
+        network.state = np.zeros(len(self.node_keys))
+        network.prepare_buffers()
+
+        return network
+
+    # Changes the weight of the connection between two nodes. Returns False if
+    # there's no such connection
+    def set_weight(self, in_node_key, out_node_key, weight):
+        position = self.connection_positions.get((in_node_key, out_node_key))
+        if position is None:
+            return False
+
+        self.weights[position] = weight
+        self.rank_weights[self.rank_positions[position]] = weight
+        return True
+
+    # Changes the activation function of a node. Returns False if the node
+    # doesn't exist, or has no inputs (so it's never activated)
+    def set_activation_function(self, node_key, function):
+        if node_key not in self.node_keys:
+            return False
+
+        node_position = self.node_keys.index(node_key)
+        if node_position not in self.evaluation_nodes:
+            return False
+
+        computed_position = self.computed_nodes.tolist().index(node_position)
+        self.activation_ids[computed_position] = activation_functions.get_function_id(function)
+        self.evaluation_functions[self.evaluation_nodes.index(node_position)] = function
+        return True
+
+    def set_inputs(self, inputs):
+        for key, position in zip(self.input_nodes_keys, self.input_positions):
+            self.state[position] = inputs[key]
+
+    def get_outputs(self):
+        return {key: self.state.item(position) for key, position in zip(self.output_nodes_keys, self.output_positions)}
+
+    def activate(self):
+        if len(self.sums) == 0:
+            return
+
+        np.take(self.state, self.rank_sources, out=self.gathered)
+        np.multiply(self.gathered, self.rank_weights, out=self.gathered)
+
+        np.copyto(self.sums, self.first_rank)
+        for sums, values in self.rank_views:
+            np.add(sums, values, out=sums)
+
+        state = self.state
+        sums = self.sums
+        for position, node, function in zip(range(len(sums)), self.evaluation_nodes, self.evaluation_functions):
+            state[node] = function(sums.item(position))
+
+    def flush(self):
+        self.state.fill(0)
+
+
+# Functions making step functions for every network structure, by structure.
+# See GeneratedNetwork. Once full, the oldest structure is dropped for every
+# new one
+step_factory_cache = dict()
+step_factory_cache_size = 4096
+
+# Connections added up per line of generated code. Longer expressions can
+# make the Python compiler run out of stack
+max_terms_per_line = 32
+
+
+# Writes the source of a function that, given the weights and the activation
+# functions of a network, returns its step function. The step function takes
+# the list of node outputs, and returns the new one.
+# Every node gets a local variable, and weights and functions are closure
+# variables, so a step is a straight sequence of multiplications and additions
+# with no loops or lookups. Inputs are added in order, so results are exactly
+# the same as in CompiledNetwork
+def get_step_factory_source(node_count, computed_nodes, segment_starts, sources):
+    segment_ends = segment_starts[1:] + [len(sources)]
+
+    lines = ["def make_step(weights, functions):"]
+    if sources:
+        lines.append("    " + ", ".join("w{}".format(i) for i in range(0, len(sources))) + ", = weights")
+    if computed_nodes:
+        lines.append("    " + ", ".join("f{}".format(i) for i in range(0, len(computed_nodes))) + ", = functions")
+
+    lines.append("    def step(state):")
+    if node_count:
+        lines.append("        " + ", ".join("n{}".format(i) for i in range(0, node_count)) + ", = state")
+
+    results = ["n{}".format(i) for i in range(0, node_count)]
+    for computed, (node, start, end) in enumerate(zip(computed_nodes, segment_starts, segment_ends)):
+        terms = ["n{} * w{}".format(sources[i], i) for i in range(start, end)]
+        for chunk_start in range(0, len(terms), max_terms_per_line):
+            chunk = terms[chunk_start:chunk_start + max_terms_per_line]
+            if chunk_start == 0:
+                lines.append("        s{} = {}".format(computed, " + ".join(chunk)))
+            else:
+                lines.append("        s{} = s{} + {}".format(computed, computed, " + ".join(chunk)))
+        results[node] = "f{}(s{})".format(computed, computed)
+
+    lines.append("        return [{}]".format(", ".join(results)))
+    lines.append("    return step")
+
+    return "\n".join(lines)
+
+
+def get_step_factory(node_count, computed_nodes, segment_starts, sources):
+    key = (node_count, tuple(computed_nodes), tuple(segment_starts), tuple(sources))
+    factory = step_factory_cache.get(key)
+    if factory is None:
+        source = get_step_factory_source(node_count, computed_nodes, segment_starts, sources)
+        namespace = dict()
+        exec(compile(source, "<generated network>", "exec"), namespace)
+        factory = namespace["make_step"]
+
+        if len(step_factory_cache) >= step_factory_cache_size:
+            del step_factory_cache[next(iter(step_factory_cache))]
+        step_factory_cache[key] = factory
+
+    return factory
+
+
+# A CompiledNetwork evaluated by Python code generated for its structure (see
+# get_step_factory_source). It's the fastest option for the small networks
+# cats usually have.
+# The generated code only depends on the structure, so it's shared by every
+# network with the same one. Changing weights or activation functions only
+# takes a new step function, made from the same code
+class GeneratedNetwork(CompiledNetwork):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.state = [0.0] * len(self.node_keys)
+        self.step_factory = get_step_factory(
+            len(self.node_keys),
+            self.computed_nodes.tolist(),
+            self.segment_starts.tolist(),
+            self.sources.tolist()
+        )
+        self.step = None
+
+    def make_step(self):
+        functions = [activation_functions.functions[i] for i in self.activation_ids.tolist()]
+        self.step = self.step_factory(self.weights.tolist(), functions)
+
+    # Step functions don't keep any state, so copies can share it until their
+    # weights or functions change
+    def copy(self):
+        network = super().copy()
+        network.state = [0.0] * len(self.node_keys)
+
+        return network
+
+    def set_weight(self, in_node_key, out_node_key, weight):
+        changed = super().set_weight(in_node_key, out_node_key, weight)
+        if changed:
+            self.step = None
+        return changed
+
+    def set_activation_function(self, node_key, function):
+        changed = super().set_activation_function(node_key, function)
+        if changed:
+            self.step = None
+        return changed
+
+    def get_outputs(self):
+        return {key: self.state[position] for key, position in zip(self.output_nodes_keys, self.output_positions)}
+
+    def activate(self):
+        if self.step is None:
+            self.make_step()
+        self.state = self.step(self.state)
+
+    def flush(self):
+        self.state = [0.0] * len(self.node_keys)
+
 
 def save_network(network, path):
     network_params = dict()
@@ -212,10 +659,13 @@ def load_network(path, functions_dict):
     for node_dict in node_dicts:
         id = node_dict["id"]
         function_name = node_dict["activation_function_id"]
-        activation_function = functions_dict[function_name]
+        # Input nodes don't have activation functions
+        activation_function = None
+        if function_name != 'None':
+            activation_function = functions_dict[function_name]
 
         if id in input_nodes_keys:
-            new_network.add_input_node(id, activation_function)
+            new_network.add_input_node(id)
         elif id in output_nodes_keys:
             new_network.add_output_node(id, activation_function)
         else:
@@ -225,4 +675,4 @@ def load_network(path, functions_dict):
         for input_node, input_weight in zip(node_dict["inputs"], node_dict["conn_weights"]):
             new_network.add_connection(input_weight, input_node, node_dict["id"])
 
-    return new_network
\ No newline at end of file
+    return new_network
@@ -0,0 +1,367 @@
+import atexit
+import multiprocessing
+import types
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from population_inference import PopulationInferenceEngine
+from sensing import get_sensor_arrays, get_sector_min_distances
+
+
+# Splits the per cat work of a tick (sensing and brains) across worker
+# processes.
+#
+# Every tick, the main process writes a snapshot of what the workers need
+# (sensor and target positions, brain inputs) to shared memory, and every
+# worker works on its own share of the rows, writing its results back to
+# shared memory. Workers only read the snapshot, and never touch the
+# simulation objects. Everything else (movement, eating, splitting, deaths) is
+# still done by the main process, in registry order, so a run goes exactly
+# the same way with any number of workers, or with none.
+#
+# Brains are split among workers, and stay with the same worker for their
+# whole life: every worker keeps its own PopulationInferenceEngine, with the
+# state of its brains. Since brains never connect to each other, the results
+# are the same as with a single engine.
+#
+# Only worth it for big worlds. Every tick waits for every worker twice, which
+# takes longer than doing the work in place when there are few cats.
+
+# Shared memory blocks are bigger than needed by this factor, so they don't
+# need to be replaced every time the world grows a bit
+GROWTH_FACTOR = 2
+MIN_BLOCK_SIZE = 1 << 16
+ALIGNMENT = 64
+
+
+# Byte offset of every array of a layout (a list of (name, shape, dtype)
+# tuples), and the size of the whole layout
+def get_offsets(layout):
+    offsets = []
+    size = 0
+    for name, shape, dtype in layout:
+        offsets.append(size)
+        nbytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+        size += -(-nbytes // ALIGNMENT) * ALIGNMENT
+
+    return offsets, size
+
+
+def get_arrays(buffer, layout):
+    offsets, size = get_offsets(layout)
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        for (name, shape, dtype), offset in zip(layout, offsets)
+    }
+
+
+# Arrays in a block of shared memory, written by the main process and read
+# (or filled) by the workers. Layouts can change every tick. When they don't
+# fit in the block anymore, it's replaced by a bigger one with a new name, so
+# workers know they have to open it again
+class SharedArrays:
+
+    def __init__(self):
+        self.memory = None
+        self.layout = None
+        self.arrays = None
+
+    # Arrays for layout, by name. They're only valid until the next call
+    def reserve(self, layout):
+        size = get_offsets(layout)[1]
+        self.arrays = None
+        if self.memory is None or self.memory.size < size:
+            self.close()
+            self.memory = shared_memory.SharedMemory(create=True, size=max(size * GROWTH_FACTOR, MIN_BLOCK_SIZE))
+
+        self.layout = layout
+        self.arrays = get_arrays(self.memory.buf, layout)
+        return self.arrays
+
+    # What workers need to find the arrays
+    def get_description(self):
+        return self.memory.name, self.layout
+
+    def close(self):
+        self.arrays = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+# Worker side
+
+class Worker:
+
+    def __init__(self):
+        # channel -> SharedMemory it's using
+        self.memories = dict()
+
+        self.engine = None
+        # Brain slot in the main process -> slot in engine
+        self.engine_slots = dict()
+
+    # Arrays written by the main process for a channel, opening its shared
+    # memory again if it was replaced
+    def get_arrays(self, channel, name, layout):
+        memory = self.memories.get(channel)
+        if memory is None or memory.name != name:
+            if memory is not None:
+                memory.close()
+            memory = shared_memory.SharedMemory(name=name)
+            self.memories[channel] = memory
+
+        return get_arrays(memory.buf, layout)
+
+    def setup_engine(self, input_keys, output_keys):
+        self.engine = PopulationInferenceEngine(input_keys, output_keys)
+        self.engine_slots = dict()
+
+    # Applies the brains added and removed since the last call, then runs one
+    # step of the brains in slots, with inputs and outputs in the given rows
+    def activate(self, channel, name, layout, changes, rows, slots):
+        for change in changes:
+            if change[0] == "add":
+                self.engine_slots[change[1]] = self.engine.add(change[2])
+            else:
+                self.engine.remove(self.engine_slots.pop(change[1]))
+
+        if len(rows):
+            arrays = self.get_arrays(channel, name, layout)
+            arrays["outputs"][rows] = self.engine.activate(
+                [self.engine_slots[slot] for slot in slots.tolist()],
+                arrays["inputs"][rows]
+            )
+
+    # Computes the (group, start, end) row ranges of the sensor snapshot
+    def sense(self, channel, name, layout, shards):
+        arrays = self.get_arrays(channel, name, layout)
+        for group, start, end in shards:
+            prefix = str(group) + "."
+            arrays[prefix + "min_distances"][start:end] = get_sector_min_distances(
+                arrays[prefix + "sensor_positions"][start:end],
+                arrays[prefix + "world_rotations"][start:end],
+                arrays[prefix + "max_ranges"][start:end],
+                arrays[prefix + "half_fovs"][start:end],
+                arrays[prefix + "ignored"][start:end],
+                arrays[prefix + "target_positions"]
+            )
+
+    def close(self):
+        for memory in self.memories.values():
+            memory.close()
+
+
+# Runs in every worker process. Messages are (method name, arguments...)
+# tuples, answered with None once done. None stops it
+def run_worker(connection):
+    worker = Worker()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        getattr(worker, message[0])(*message[1:])
+        connection.send(None)
+
+    worker.close()
+    connection.close()
+
+
+# Main process side
+
+class WorkerPool:
+
+    def __init__(self, worker_count):
+        self.worker_count = worker_count
+        self.processes = []
+        self.connections = []
+
+        # Workers have to share the resource tracker of this process.
+        # Otherwise each one starts its own, which removes the shared memory
+        # it opened when the worker stops
+        resource_tracker.ensure_running()
+        for index in range(0, worker_count):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+        # Shared memory used by the pool's engines, closed along with it
+        self.shared_arrays = []
+
+        atexit.register(self.close)
+
+    def __len__(self):
+        return self.worker_count
+
+    def get_shared_arrays(self):
+        shared = SharedArrays()
+        self.shared_arrays.append(shared)
+        return shared
+
+    # Sends every worker its message, and waits until all of them are done
+    def run(self, messages):
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        for connection in self.connections:
+            connection.recv()
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        for shared in self.shared_arrays:
+            shared.close()
+
+        self.processes = []
+        self.connections = []
+        self.shared_arrays = []
+        atexit.unregister(self.close)
+
+
+# The parts of a CompiledNetwork PopulationInferenceEngine.add uses. Networks
+# can carry generated code, which can't be sent to other processes
+def get_network_arrays(network):
+    return types.SimpleNamespace(
+        node_keys=list(network.node_keys),
+        state=network.state,
+        sources=network.sources,
+        segment_starts=network.segment_starts,
+        computed_nodes=network.computed_nodes,
+        weights=network.weights,
+        activation_ids=network.activation_ids
+    )
+
+
+# Same interface as PopulationInferenceEngine, with the brains split among the
+# workers of a WorkerPool. New brains go to the worker with fewer brains
+class ShardedInferenceEngine:
+
+    def __init__(self, pool, input_keys, output_keys):
+        self.pool = pool
+        self.input_keys = list(input_keys)
+        self.output_keys = list(output_keys)
+        self.shared = pool.get_shared_arrays()
+
+        # slot -> worker having the brain, or -1 if the slot is free
+        self.slot_workers = np.zeros(0, dtype=np.intp)
+        self.free_slots = []
+        self.worker_sizes = [0] * len(pool)
+        # Brains added and removed on every worker, sent along with the next
+        # activation
+        self.changes = [[] for i in range(0, len(pool))]
+
+        pool.run([("setup_engine", self.input_keys, self.output_keys)] * len(pool))
+
+    def __len__(self):
+        return sum(self.worker_sizes)
+
+    def add(self, network):
+        worker = self.worker_sizes.index(min(self.worker_sizes))
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = len(self.slot_workers)
+            self.slot_workers = np.append(self.slot_workers, -1)
+
+        self.slot_workers[slot] = worker
+        self.worker_sizes[worker] += 1
+        self.changes[worker].append(("add", slot, get_network_arrays(network)))
+
+        return slot
+
+    def remove(self, slot):
+        worker = self.slot_workers[slot]
+        self.slot_workers[slot] = -1
+        self.free_slots.append(slot)
+        self.worker_sizes[worker] -= 1
+        self.changes[worker].append(("remove", slot))
+
+    def activate(self, slots, inputs):
+        slots = np.asarray(slots, dtype=np.intp)
+        inputs = np.asarray(inputs, dtype=float)
+
+        arrays = self.shared.reserve([
+            ("inputs", inputs.shape, inputs.dtype.str),
+            ("outputs", (len(slots), len(self.output_keys)), np.dtype(float).str),
+        ])
+        arrays["inputs"][:] = inputs
+        name, layout = self.shared.get_description()
+
+        workers = self.slot_workers[slots]
+        messages = []
+        for worker in range(0, len(self.pool)):
+            rows = np.flatnonzero(workers == worker)
+            messages.append(("activate", "brains", name, layout, self.changes[worker], rows, slots[rows]))
+        self.changes = [[] for i in range(0, len(self.pool))]
+
+        self.pool.run(messages)
+
+        return arrays["outputs"].copy()
+
+
+# Same interface as BatchSensorEngine. Sensors looking for every tag are split
+# evenly among the workers of a WorkerPool
+class ParallelSensorEngine:
+
+    array_names = ["sensor_positions", "world_rotations", "max_ranges", "half_fovs", "ignored", "target_positions"]
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.shared = pool.get_shared_arrays()
+
+    def run(self, sensors, tag_members):
+        # Sensors looking for the same tag share the same list of targets
+        groups = dict()
+        for sensor in sensors:
+            groups.setdefault(sensor.detection_tag, []).append(sensor)
+        groups = list(groups.values())
+        if not groups:
+            return
+
+        snapshots = [
+            get_sensor_arrays(group, list(tag_members.get(group[0].detection_tag, dict())))
+            for group in groups
+        ]
+
+        layout = []
+        for index, snapshot in enumerate(snapshots):
+            prefix = str(index) + "."
+            for array_name, array in zip(self.array_names, snapshot):
+                layout.append((prefix + array_name, array.shape, array.dtype.str))
+            layout.append((prefix + "min_distances", (len(groups[index]),), np.dtype(float).str))
+
+        arrays = self.shared.reserve(layout)
+        for index, snapshot in enumerate(snapshots):
+            prefix = str(index) + "."
+            for array_name, array in zip(self.array_names, snapshot):
+                arrays[prefix + array_name][:] = array
+        name, layout = self.shared.get_description()
+
+        worker_count = len(self.pool)
+        messages = []
+        for worker in range(0, worker_count):
+            shards = [
+                (index, len(group) * worker // worker_count, len(group) * (worker + 1) // worker_count)
+                for index, group in enumerate(groups)
+            ]
+            messages.append(("sense", "sensing", name, layout, shards))
+
+        self.pool.run(messages)
+
+        for index, group in enumerate(groups):
+            min_distances = arrays[str(index) + ".min_distances"].tolist()
+            for sensor, min_distance in zip(group, min_distances):
+                sensor.min_distance = min_distance
+                sensor.min_distance_normalized = min_distance / sensor.max_range
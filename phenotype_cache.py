@@ -0,0 +1,99 @@
+import hashlib
+import sys
+
+import numpy as np
+
+import metrics
+
+
+# Keeps networks built by Brain.build_network, so brains with the same enabled
+# genes (a common thing after cloning) can get a copy instead of building
+# their own.
+# Networks are stored by a hash of everything build_network depends on (see
+# get_genotype_hash), and dropped in least recently used order once they take
+# more than max_bytes. Hits, misses and evictions are reported to metrics,
+# under the "phenotype_cache." prefix.
+
+class PhenotypeCache:
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+        # hash -> (network, broken connections, size). Dict order is the usage
+        # order, the least recently used entry comes first
+        self.entries = dict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Returns (network, broken connections) if there's a network for the hash,
+    # or None otherwise. The network is shared, so it must be copied before
+    # being used
+    def get(self, genotype_hash):
+        entry = self.entries.pop(genotype_hash, None)
+        if entry is None:
+            metrics.increment("phenotype_cache.misses")
+            return None
+
+        # Move it to the end, as the most recently used
+        self.entries[genotype_hash] = entry
+        metrics.increment("phenotype_cache.hits")
+        return entry[0], entry[1]
+
+    def put(self, genotype_hash, network, broken_connections):
+        if genotype_hash in self.entries:
+            return
+
+        size = get_network_size(network) + sys.getsizeof(genotype_hash)
+        if size > self.max_bytes:
+            return
+
+        self.entries[genotype_hash] = (network, broken_connections, size)
+        self.bytes += size
+
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.bytes -= self.entries.pop(oldest)[2]
+            metrics.increment("phenotype_cache.evictions")
+
+        metrics.set_gauge("phenotype_cache.bytes", self.bytes)
+        metrics.set_gauge("phenotype_cache.entries", len(self.entries))
+
+    def clear(self):
+        self.entries = dict()
+        self.bytes = 0
+
+
+# Hash of everything Brain.build_network depends on: input and output nodes,
+# the enabled genes, in order, and the build settings. Weights are hashed as
+# raw bytes, so equal hashes mean bit-identical weights
+def get_genotype_hash(brain):
+    genotype = brain.genotype
+    rows = genotype.get_rows(enabled=True)
+
+    parts = [
+        repr(brain.input_keys).encode(),
+        repr([(key, function.__name__) for key, function in brain.output_nodes.items()]).encode(),
+        repr((brain.allow_recurrency, brain.network_class)).encode(),
+        # Node indexes depend on the order nodes were found, so keys are
+        # needed too
+        repr(genotype.node_keys).encode()
+    ]
+    for name in genotype.array_names:
+        parts.append(getattr(genotype, name)[rows].tobytes())
+
+    return hashlib.blake2b(b"|".join(parts), digest_size=16).digest()
+
+
+# Rough number of bytes taken by a network: NumPy arrays, plus the containers
+# it holds directly (not counting the objects inside them)
+def get_network_size(network):
+    size = sys.getsizeof(network)
+    for value in vars(network).values():
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, (list, dict, tuple)):
+            size += sys.getsizeof(value)
+
+    return size
@@ -0,0 +1,196 @@
+import numpy as np
+
+import activation_functions
+
+
+# Evaluates the brains of a whole population at once.
+#
+# Every CompiledNetwork added to the engine gets a block of nodes and
+# connections inside a few big arrays, shared by all brains. Since brains are
+# never connected to each other, the whole population behaves like a single
+# network made of independent pieces, and one step of every brain only takes a
+# handful of NumPy operations.
+#
+# Brains can be added and removed at any moment. New blocks are appended at the
+# end of the arrays (which grow by doubling their size), and removed blocks are
+# only switched off. Arrays are compacted once switched off blocks take more
+# than half of them.
+
+class PopulationInferenceEngine:
+
+    def __init__(self, input_keys, output_keys, capacity=1024):
+        self.input_keys = list(input_keys)
+        self.output_keys = list(output_keys)
+
+        # Nodes
+        self.node_count = 0
+        self.state = np.zeros(capacity)
+        # Activation function id of every node (see activation_functions), or
+        # -1 for nodes without inputs (and removed ones)
+        self.function_ids = np.full(capacity, -1, dtype=np.intp)
+
+        # Connections
+        self.connection_count = 0
+        self.sources = np.zeros(capacity, dtype=np.intp)
+        self.targets = np.zeros(capacity, dtype=np.intp)
+        self.weights = np.zeros(capacity)
+
+        # slot -> [node_start, node_count, connection_start, connection_count],
+        # or None if the slot is free
+        self.blocks = []
+        self.free_slots = []
+        self.removed_nodes = 0
+
+        # slot -> global position of every input and output node. Like the
+        # arrays above, they have room for more slots than there are
+        self.input_nodes = np.zeros((0, len(self.input_keys)), dtype=np.intp)
+        self.output_nodes = np.zeros((0, len(self.output_keys)), dtype=np.intp)
+
+        # Nodes grouped by activation function, rebuilt after any change
+        self.function_groups = None
+
+    def __len__(self):
+        return len(self.blocks) - len(self.free_slots)
+
+    @staticmethod
+    def grow(array, size):
+        if size <= len(array):
+            return array
+
+        new_array = np.zeros((max(size, len(array) * 2),) + array.shape[1:], dtype=array.dtype)
+        new_array[:len(array)] = array
+        return new_array
+
+    # Adds a brain, and returns the slot identifying it
+    def add(self, network):
+        node_start = self.node_count
+        node_count = len(network.node_keys)
+        connection_start = self.connection_count
+        connection_count = len(network.sources)
+
+        self.node_count += node_count
+        self.state = self.grow(self.state, self.node_count)
+        if len(self.function_ids) < self.node_count:
+            function_ids = np.full(max(self.node_count, len(self.function_ids) * 2), -1, dtype=np.intp)
+            function_ids[:len(self.function_ids)] = self.function_ids
+            self.function_ids = function_ids
+
+        self.connection_count += connection_count
+        self.sources = self.grow(self.sources, self.connection_count)
+        self.targets = self.grow(self.targets, self.connection_count)
+        self.weights = self.grow(self.weights, self.connection_count)
+
+        # Brain nodes keep their positions, shifted to the start of the block
+        self.state[node_start:self.node_count] = network.state
+
+        connection_range = slice(connection_start, self.connection_count)
+        self.sources[connection_range] = network.sources + node_start
+        input_counts = np.diff(np.append(network.segment_starts, connection_count))
+        self.targets[connection_range] = np.repeat(network.computed_nodes, input_counts) + node_start
+        self.weights[connection_range] = network.weights
+
+        self.function_ids[network.computed_nodes + node_start] = network.activation_ids
+
+        positions = {key: position + node_start for position, key in enumerate(network.node_keys)}
+        input_nodes = [positions[key] for key in self.input_keys]
+        output_nodes = [positions[key] for key in self.output_keys]
+
+        block = [node_start, node_count, connection_start, connection_count]
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.blocks[slot] = block
+        else:
+            slot = len(self.blocks)
+            self.blocks.append(block)
+            self.input_nodes = self.grow(self.input_nodes, len(self.blocks))
+            self.output_nodes = self.grow(self.output_nodes, len(self.blocks))
+
+        self.input_nodes[slot] = input_nodes
+        self.output_nodes[slot] = output_nodes
+
+        self.function_groups = None
+
+        return slot
+
+    def remove(self, slot):
+        node_start, node_count, connection_start, connection_count = self.blocks[slot]
+
+        # Switch the block off. Its nodes won't be activated anymore, and its
+        # connections won't add anything
+        self.function_ids[node_start:node_start + node_count] = -1
+        self.state[node_start:node_start + node_count] = 0
+        self.weights[connection_start:connection_start + connection_count] = 0
+
+        self.blocks[slot] = None
+        self.free_slots.append(slot)
+        self.removed_nodes += node_count
+        self.function_groups = None
+
+        if self.removed_nodes * 2 > self.node_count:
+            self.compact()
+
+    # Moves the blocks still in use to the beginning of the arrays, in slot
+    # order. Slots don't change
+    def compact(self):
+        node_map = np.full(self.node_count, -1, dtype=np.intp)
+        node_parts = []
+        connection_parts = []
+        node_count = 0
+        connection_count = 0
+
+        for block in self.blocks:
+            if block is None:
+                continue
+
+            node_start, nodes, connection_start, connections = block
+            node_map[node_start:node_start + nodes] = np.arange(node_count, node_count + nodes)
+            node_parts.append(np.arange(node_start, node_start + nodes))
+            connection_parts.append(np.arange(connection_start, connection_start + connections))
+
+            block[0] = node_count
+            block[2] = connection_count
+            node_count += nodes
+            connection_count += connections
+
+        kept_nodes = np.concatenate(node_parts) if node_parts else np.zeros(0, dtype=np.intp)
+        kept_connections = np.concatenate(connection_parts) if connection_parts else np.zeros(0, dtype=np.intp)
+
+        self.state = self.state[kept_nodes]
+        self.function_ids = self.function_ids[kept_nodes]
+        self.sources = node_map[self.sources[kept_connections]]
+        self.targets = node_map[self.targets[kept_connections]]
+        self.weights = self.weights[kept_connections]
+
+        slot_count = len(self.blocks)
+        self.input_nodes[:slot_count] = node_map[self.input_nodes[:slot_count]]
+        self.output_nodes[:slot_count] = node_map[self.output_nodes[:slot_count]]
+
+        self.node_count = node_count
+        self.connection_count = connection_count
+        self.removed_nodes = 0
+        self.function_groups = None
+
+    def get_function_groups(self):
+        if self.function_groups is None:
+            self.function_groups = activation_functions.get_function_groups(self.function_ids[:self.node_count])
+
+        return self.function_groups
+
+    # Runs one step of the brains in slots. inputs is a matrix with one row per
+    # slot, and one column per input key. Returns a matrix with one row per
+    # slot, and one column per output key.
+    # Just like CompiledNetwork, every node sees the outputs other nodes had
+    # before the present step
+    def activate(self, slots, inputs):
+        slots = np.asarray(slots, dtype=np.intp)
+        state = self.state
+
+        state[self.input_nodes[slots]] = inputs
+
+        count = self.connection_count
+        products = state[self.sources[:count]] * self.weights[:count]
+        sums = np.bincount(self.targets[:count], weights=products, minlength=self.node_count)
+
+        activation_functions.apply_functions(self.get_function_groups(), sums, state)
+
+        return state[self.output_nodes[slots]]
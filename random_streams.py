@@ -0,0 +1,54 @@
+import random
+import zlib
+
+import numpy as np
+
+
+# Seeded random number streams.
+#
+# A RandomStream is a random.Random (so it has random(), choice(), uniform(),
+# randint() and the rest), with a NumPy Generator in array for drawing lots of
+# numbers at once.
+#
+# Streams split off child streams by key, like world.child("burgers") or
+# cats.child(cat_number). A child only depends on the seed of its parent and
+# its key, not on how many numbers were drawn before or on the order children
+# were made in. That way every cat gets the same numbers whether the simulation
+# runs in a single process or split across several. Streams are built on
+# NumPy's SeedSequence, which keeps children with different keys independent.
+
+class RandomStream(random.Random):
+
+    # seed can be any int, or None to pick a random one
+    def __init__(self, seed=None, seed_sequence=None):
+        if seed_sequence is None:
+            seed_sequence = np.random.SeedSequence(seed)
+        self.seed_sequence = seed_sequence
+
+        state = seed_sequence.generate_state(4, np.uint64)
+        super().__init__(int.from_bytes(state.tobytes(), "little"))
+        self.array = np.random.Generator(np.random.PCG64(seed_sequence))
+
+    # Child stream for key, which can be an int or a str
+    def child(self, key):
+        if isinstance(key, str):
+            key = zlib.crc32(key.encode())
+
+        return RandomStream(seed_sequence=np.random.SeedSequence(
+            self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (key,),
+            pool_size=self.seed_sequence.pool_size
+        ))
+
+    # Streams are pickled with the state of both generators, so they can be
+    # sent to other processes and go on from where they were
+    def __reduce__(self):
+        return RandomStream, (None, self.seed_sequence), (self.getstate(), self.array.bit_generator.state)
+
+    def __setstate__(self, state):
+        self.setstate(state[0])
+        self.array.bit_generator.state = state[1]
+
+
+# Stream used by anything that wasn't given one
+default_stream = RandomStream()
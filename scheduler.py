@@ -0,0 +1,37 @@
+import heapq
+
+# Calls things at given times of a simulation clock.
+#
+# Events are kept in a heap ordered by time. Events due at the same time are
+# called in the order they were scheduled, so runs always go the same way.
+# Repeating events are scheduled again from the time they were due (not from
+# the time they ran), so they don't drift.
+
+
+class Scheduler:
+
+    def __init__(self):
+        # (time, order, callback, period) heap. period is None for events that
+        # only happen once
+        self.events = []
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.events)
+
+    def schedule(self, time, callback, period=None):
+        heapq.heappush(self.events, (time, self.next_order, callback, period))
+        self.next_order += 1
+
+    # Calls callback every period, starting one period after start_time
+    def schedule_every(self, period, callback, start_time=0):
+        self.schedule(start_time + period, callback, period)
+
+    # Calls every event due at time or before, in order. Repeating events that
+    # fall due again meanwhile get called again too
+    def run_until(self, time):
+        while self.events and self.events[0][0] <= time:
+            event_time, order, callback, period = heapq.heappop(self.events)
+            if period is not None:
+                self.schedule(event_time + period, callback, period)
+            callback()
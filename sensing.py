@@ -0,0 +1,120 @@
+import numpy as np
+
+
+# Evaluates every SectorSensor at once. Instead of letting each sensor scan the
+# world and do its own trigonometry, the positions of every possible target are
+# gathered into arrays once per tick, and the distances and bearings between
+# sensors and targets are computed as whole matrices.
+
+class BatchSensorEngine:
+
+    # tag_members is a dict with the objects containing each tag, like
+    # SimulationBaseObject.tag_members
+    def run(self, sensors, tag_members):
+        # Sensors looking for the same tag share the same list of targets
+        groups = dict()
+        for sensor in sensors:
+            groups.setdefault(sensor.detection_tag, []).append(sensor)
+
+        for tag, group in groups.items():
+            targets = list(tag_members.get(tag, dict()))
+            min_distances = self.get_min_distances(group, targets)
+
+            for sensor, min_distance in zip(group, min_distances.tolist()):
+                sensor.min_distance = min_distance
+                sensor.min_distance_normalized = min_distance / sensor.max_range
+
+    @staticmethod
+    def get_min_distances(sensors, targets):
+        return get_sector_min_distances(*get_sensor_arrays(sensors, targets))
+
+
+# Everything needed to evaluate sensors against targets, as arrays: sensor
+# world positions and rotations, max ranges, half fields of view, index of the
+# target each sensor ignores (or -1), and target world positions
+def get_sensor_arrays(sensors, targets):
+    sensor_positions, world_rotations = get_world_transforms(sensors)
+    max_ranges = np.array([sensor.max_range for sensor in sensors], dtype=float)
+    half_fovs = np.array([sensor.fov_angle / 2 for sensor in sensors], dtype=float)
+
+    target_indexes = {target: index for index, target in enumerate(targets)}
+    ignored = np.array([target_indexes.get(sensor.ignore_object, -1) for sensor in sensors], dtype=np.intp)
+
+    target_positions = get_world_transforms(targets)[0]
+
+    return sensor_positions, world_rotations, max_ranges, half_fovs, ignored, target_positions
+
+
+# Maximum number of (sensor, target) pairs evaluated at once, to keep memory
+# bounded. Sensors are split in blocks of rows with about this many pairs each
+max_chunk_size = 1 << 20
+
+
+# Distance to the closest target seen by every sensor, or its max range. Works
+# on the arrays from get_sensor_arrays, so sensors can be split in groups and
+# evaluated anywhere (see parallel_tick) with the same results
+def get_sector_min_distances(sensor_positions, world_rotations, max_ranges, half_fovs, ignored, target_positions):
+    if len(target_positions) == 0 or len(sensor_positions) == 0:
+        return max_ranges.copy()
+
+    # Every sensor only depends on its own row, so rows can be split freely
+    min_distances = np.empty(len(sensor_positions))
+    chunk_rows = max(1, max_chunk_size // len(target_positions))
+    for start in range(0, len(sensor_positions), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        min_distances[rows] = get_block_min_distances(
+            sensor_positions[rows], world_rotations[rows], max_ranges[rows], half_fovs[rows], ignored[rows],
+            target_positions
+        )
+
+    return min_distances
+
+
+# get_sector_min_distances for a block of sensors, all at once
+def get_block_min_distances(sensor_positions, world_rotations, max_ranges, half_fovs, ignored, target_positions):
+    # Sensors sharing a world position (like the ones on the same cat) only
+    # need their distances and bearings to be computed once
+    origins, origin_indexes = np.unique(sensor_positions, axis=0, return_inverse=True)
+    origin_indexes = origin_indexes.reshape(-1)
+
+    delta_x = target_positions[:, 0] - origins[:, 0, np.newaxis]
+    delta_y = target_positions[:, 1] - origins[:, 1, np.newaxis]
+    distances = np.sqrt((delta_x ** 2) + (delta_y ** 2))
+    bearings = np.arctan2(delta_y, delta_x)
+
+    sensor_distances = distances[origin_indexes]
+
+    # Angle of every target relative to the sensor. It follows the same
+    # steps as SectorSensor.register_detection, so targets sitting right
+    # on top of a sensor are handled the same way as in Cat.perceive
+    angles = bearings[origin_indexes] - world_rotations[:, np.newaxis]
+    angles = np.arctan2(np.sin(angles) * sensor_distances, np.cos(angles) * sensor_distances)
+
+    detected = (sensor_distances < max_ranges[:, np.newaxis]) & (np.abs(angles) < half_fovs[:, np.newaxis])
+
+    # Sensors can't detect their ignore_object
+    rows = np.flatnonzero(ignored >= 0)
+    detected[rows, ignored[rows]] = False
+
+    sensor_distances = np.where(detected, sensor_distances, max_ranges[:, np.newaxis])
+
+    return sensor_distances.min(axis=1)
+
+
+# Returns an array with the world positions of objects, and another one with
+# their world rotations. If the objects live in an EntityStore, the values are
+# read straight from its arrays
+def get_world_transforms(objects):
+    slots = [instance.slot for instance in objects]
+
+    if objects and None not in slots:
+        for instance in objects:
+            if instance.transform_dirty:
+                instance.refresh_transform()
+
+        store = objects[0].entity_store
+        return store.world_position[slots], store.world_rotation[slots]
+
+    positions = np.array([instance.world_position for instance in objects], dtype=float).reshape(-1, 2)
+    rotations = np.array([instance.world_rotation for instance in objects], dtype=float)
+    return positions, rotations
@@ -0,0 +1,1241 @@
+import colorsys
+import math
+import os
+import random
+import time
+import types
+
+import catnames  # I can't believe this library exists... anyway, less work for me xD
+
+import activation_functions
+import metrics
+from entity_registry import EntityRegistry
+from entity_store import EntityStore, install_stored_fields, remove_stored_fields
+from evolution import EvolutionOptions, Brain
+import neural_network as nn
+from parallel_tick import WorkerPool, ShardedInferenceEngine, ParallelSensorEngine
+from phenotype_cache import PhenotypeCache
+from population_inference import PopulationInferenceEngine
+from random_streams import RandomStream
+from scheduler import Scheduler
+from sensing import BatchSensorEngine
+from spatial_hash import SpatialHashGrid
+from speciation import SpeciesSet
+
+
+# The simulation itself: cats, burgers and the arena they live in, and the
+# Simulation class that owns them and moves them forward in time. Nothing here
+# needs pygame, so it can run without a display (see main.py for the viewer).
+
+# A few helper functions
+
+def get_distance(point1, point2):
+    return math.sqrt(((point2[0] - point1[0]) ** 2) + ((point2[1] - point1[1]) ** 2))
+
+
+def int_to_hms_string(number):
+    seconds = number % 60
+    number = int(number / 60)
+    minutes = number % 60
+    number = int(number / 60)
+    hours = number
+    return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+# Position constraints of objects that can go anywhere. Constraints are shared
+# between objects, so they should be replaced instead of modified
+UNCONSTRAINED = {
+    "min_x": -float("inf"),
+    "max_x": float("inf"),
+    "min_y": -float("inf"),
+    "max_y": float("inf"),
+}
+
+# Shared by objects without children until they get their first one
+NO_CHILDREN = types.MappingProxyType(dict())
+
+# Tag tuples are shared by every object having the same tags
+tag_tuples = dict()
+
+
+# Base object, it contains some common stuff for other objects and will be
+# inherited by them
+
+class SimulationBaseObject:
+    # Objects don't get a __dict__, which saves a lot of memory when there are
+    # tens of thousands of them. Subclasses need to declare their own __slots__
+    __slots__ = (
+        "slot", "position", "rotation", "parent", "children", "child_depth", "draw_enabled", "tags",
+        "pending_destroy", "entity_id", "registry_depth", "layer_index", "_world_position",
+        "_world_rotation", "_world_cos", "_world_sin", "transform_dirty", "position_constraints", "tagged_count"
+    )
+
+    # Every existing object, in child depth order
+    registry = EntityRegistry()
+
+    # tag -> objects containing that tag. Dicts are used as insertion ordered
+    # sets, so adding and removing members is cheap
+    tag_members = dict()
+
+    # Tagged objects are indexed by position, so sensors and cats only need
+    # to look at the objects around them
+    grid = SpatialHashGrid(cell_size=200)
+
+    # Optional EntityStore, set with set_entity_store. When set, new objects
+    # keep their position, rotation and world transform in it instead of in
+    # their own attributes
+    entity_store = None
+
+    # Attributes kept in the entity store (see entity_store.StoredField)
+    stored_fields = {
+        "position": ("position", True),
+        "rotation": ("rotation", False),
+        "_world_position": ("world_position", True),
+        "_world_rotation": ("world_rotation", False),
+    }
+
+    def __init__(self):
+        if self.entity_store is not None:
+            self.slot = self.entity_store.allocate()
+        else:
+            self.slot = None
+
+        self.position = [0, 0]
+        self.rotation = 0
+        self.parent = None
+        # Dicts are used as insertion ordered sets, so children can be removed
+        # without searching for them. A dict is only created for objects that
+        # get children
+        self.children = NO_CHILDREN
+        self.child_depth = 0
+        self.draw_enabled = True
+        self.tags = ()
+        # Number of tagged objects in this object's branch, itself included
+        self.tagged_count = 0
+        self.pending_destroy = False
+        SimulationBaseObject.registry.add(self)
+
+        # World space transform cache. It's only recomputed when it's needed
+        # after the object (or any of its ancestors) moved
+        self._world_position = [0, 0]
+        self._world_rotation = 0
+        self._world_cos = 1
+        self._world_sin = 0
+        self.transform_dirty = True
+
+        self.position_constraints = UNCONSTRAINED
+
+        self.update()
+
+    # Starts (or stops, with None) keeping new objects in an EntityStore.
+    # Stored attributes only go through the store while there's one, so
+    # objects living in the old store should be destroyed before changing it
+    @staticmethod
+    def set_entity_store(store):
+        SimulationBaseObject.entity_store = store
+
+        classes = [SimulationBaseObject]
+        for cls in classes:
+            classes.extend(cls.__subclasses__())
+            if store is not None:
+                install_stored_fields(cls)
+            else:
+                remove_stored_fields(cls)
+
+    # Tags should be added using this method, so the object can be found
+    # through get_tagged
+    def add_tag(self, tag):
+        if tag in self.tags:
+            return
+
+        if not self.tags:
+            self.add_tagged_count(1)
+        new_tags = self.tags + (tag,)
+        self.tags = tag_tuples.setdefault(new_tags, new_tags)
+        SimulationBaseObject.tag_members.setdefault(tag, dict())[self] = None
+
+        # The grid stores objects once per tag, so store it again
+        SimulationBaseObject.grid.remove(self)
+        SimulationBaseObject.grid.update(self)
+
+    # Adds delta to the tagged_count of the object and its ancestors
+    def add_tagged_count(self, delta):
+        instance = self
+        while instance is not None:
+            instance.tagged_count += delta
+            instance = instance.parent
+
+    # Returns a list with every existing object containing tag
+    @staticmethod
+    def get_tagged(tag):
+        return list(SimulationBaseObject.tag_members.get(tag, dict()))
+
+    def set_child_depth(self):
+        if self.parent is None:
+            self.child_depth = 0
+        else:
+            self.child_depth = self.parent.child_depth + 1
+
+        SimulationBaseObject.registry.set_depth(self, self.child_depth)
+
+        for child in self.children:
+            child.set_child_depth()
+
+    def set_parent(self, parent):
+        if self.parent is not None:
+            del self.parent.children[self]
+            self.parent.add_tagged_count(-self.tagged_count)
+
+        self.parent = parent
+        if self.parent is not None:
+            if self.parent.children is NO_CHILDREN:
+                self.parent.children = dict()
+            self.parent.children[self] = None
+            self.parent.add_tagged_count(self.tagged_count)
+
+        self.set_child_depth()
+
+        self.update()
+
+    @property
+    def world_position(self):
+        if self.transform_dirty:
+            self.refresh_transform()
+        return self._world_position
+
+    @property
+    def world_rotation(self):
+        if self.transform_dirty:
+            self.refresh_transform()
+        return self._world_rotation
+
+    # Recomputes the world space transform from the parent's one, which gets
+    # refreshed first if needed
+    def refresh_transform(self):
+        if self.parent is not None:
+            self._world_rotation = self.parent.get_world_rotation(self.rotation)
+            self._world_position = self.parent.get_world_position(self.position)
+        else:
+            self._world_rotation = self.rotation
+            self._world_position = self.position
+
+        self._world_cos = math.cos(self._world_rotation)
+        self._world_sin = math.sin(self._world_rotation)
+        self.transform_dirty = False
+
+    # Flags the object and all of its descendants, so their transforms get
+    # recomputed the next time they are read. Tagged ones are moved in the
+    # grid right away, since it needs to know where they are
+    def mark_transform_dirty(self):
+        self.transform_dirty = True
+        if self.tags:
+            SimulationBaseObject.grid.update(self)
+
+        for child in self.children:
+            # A dirty child can only have dirty descendants, so it can be
+            # skipped, unless there are tagged objects in its branch
+            if not child.transform_dirty or child.tagged_count:
+                child.mark_transform_dirty()
+
+    # Takes a point in local space and translates it to world space
+    def get_world_position(self, local_position):
+        if self.transform_dirty:
+            self.refresh_transform()
+
+        x = (local_position[0] * self._world_cos) - (local_position[1] * self._world_sin)
+        y = (local_position[0] * self._world_sin) + (local_position[1] * self._world_cos)
+
+        return [x + self._world_position[0], y + self._world_position[1]]
+
+    # Takes a point in world space and translates it to local space
+    def get_local_position(self, world_position):
+        if self.transform_dirty:
+            self.refresh_transform()
+
+        distance_x = world_position[0] - self._world_position[0]
+        distance_y = world_position[1] - self._world_position[1]
+
+        # Rotate by the inverse of the world rotation
+        x = (distance_x * self._world_cos) + (distance_y * self._world_sin)
+        y = (distance_y * self._world_cos) - (distance_x * self._world_sin)
+        return [x, y]
+
+    # Takes a rotation in local space and translates it to world space
+    def get_world_rotation(self, local_rotation):
+        world_rotation = local_rotation + self.world_rotation
+
+        world_rotation = math.fmod(world_rotation, math.pi * 2)
+
+        return world_rotation
+
+    # Takes a rotation in world space and translates it to local space
+    def get_local_rotation(self, world_rotation):
+        return world_rotation - self.world_rotation
+
+    # Ensures object's children will follow the parent. Their transforms are
+    # only flagged here, and recomputed when somebody reads them
+    def update(self):
+        self.mark_transform_dirty()
+
+    # To be implemented by the other classes that inherit from this one
+    # It's meant to happen once every frame
+    # Should contain code to be executed every frame
+    def frame(self, delta_time):
+        pass
+
+    # Ensures world space position and rotation stay up to date when setting
+    # position and rotation in local space
+    def set_position_rotation(self, new_position=None, new_rotation=None):
+        update = False
+        if new_position is not None:
+            self.position = new_position
+            update = True
+
+        if new_rotation is not None:
+            self.rotation = new_rotation
+            update = True
+
+        if update:
+            self.update()
+
+    # Allows to increment position and rotation without going beyond the
+    # previously established boundaries
+    def increment_position_rotation(self, position_increment=None, rotation_increment=None):
+        update = False
+        if position_increment is not None:
+            new_position = [original + increment for original, increment in zip(self.position, position_increment)]
+            if new_position[0] < self.position_constraints["min_x"]:
+                new_position[0] = self.position_constraints["min_x"]
+
+            if new_position[0] > self.position_constraints["max_x"]:
+                new_position[0] = self.position_constraints["max_x"]
+
+            if new_position[1] < self.position_constraints["min_y"]:
+                new_position[1] = self.position_constraints["min_y"]
+
+            if new_position[1] > self.position_constraints["max_y"]:
+                new_position[1] = self.position_constraints["max_y"]
+
+            self.position = new_position
+
+            update = True
+
+        if rotation_increment is not None:
+            self.rotation += rotation_increment
+            update = True
+
+        if update:
+            self.update()
+
+    # Call this method to remove an object without leaving zombie references
+    # It removes children objects as well
+    def destroy(self):
+        if self.entity_id is None:
+            # Already destroyed
+            return
+
+        SimulationBaseObject.registry.remove(self)
+        SimulationBaseObject.grid.remove(self)
+        for tag in self.tags:
+            del SimulationBaseObject.tag_members[tag][self]
+
+        # The object keeps its last state, in case something still reads it
+        if self.slot is not None:
+            self.entity_store.detach(self)
+
+        if self.parent is not None:
+            del self.parent.children[self]
+            self.parent.add_tagged_count(-self.tagged_count)
+
+        for child in self.children:
+            child.parent = None
+            child.destroy()
+
+    # Use this one instead of destroy while the registry is being iterated.
+    # The object is destroyed on the next registry flush, and flagged until
+    # then so other objects can ignore it
+    def defer_destroy(self):
+        if not self.pending_destroy:
+            self.pending_destroy = True
+            SimulationBaseObject.registry.defer(self.destroy)
+
+
+# A sensor that "sees" an area defined by a radius (max_range) and a field of view (fov_angle)
+# It outputs the distance to the closest object detected
+# Sensors don't look around by themselves. Their readings are written once every
+# cat moved and ate, by their cat's perception pass (see Cat.update_sensors), or
+# by a BatchSensorEngine
+
+class SectorSensor(SimulationBaseObject):
+    __slots__ = (
+        "max_range", "fov_angle", "debug_color", "min_distance", "min_distance_normalized",
+        "detection_tag", "ignore_object"
+    )
+
+    sensor_instances = dict()
+
+    def __init__(self, position, rotation, max_range, fov_angle, detection_tag, debug_color, ignore_object=None):
+        super().__init__()
+        SectorSensor.sensor_instances[self] = None
+        self.position = position
+        self.rotation = rotation
+        self.max_range = max_range
+        self.fov_angle = fov_angle
+        self.debug_color = debug_color
+        self.min_distance = self.max_range
+        self.min_distance_normalized = 1
+        self.draw_enabled = False
+
+        # The sensor will detect objects containing detection_tag
+        # Optionally, it will ignore a specific object (like the cat it belongs to)
+        self.detection_tag = detection_tag
+        self.ignore_object = ignore_object
+
+    def reset_reading(self):
+        self.min_distance = self.max_range
+        self.min_distance_normalized = 1
+
+    # Takes the distance and world space bearing of a candidate object and
+    # keeps it if it falls inside the sensor's sector
+    def register_detection(self, distance, bearing):
+        if distance < self.max_range:
+            # The offset is rotated into the sensor's space before taking its
+            # angle (instead of just wrapping bearing - world_rotation), so
+            # objects sitting right on top of the sensor are still detected
+            # the same way as with the old per sensor scan
+            angle = bearing - self.world_rotation
+            angle = math.atan2(math.sin(angle) * distance, math.cos(angle) * distance)
+            half_fov = self.fov_angle / 2
+
+            if -half_fov < angle < half_fov:
+                self.min_distance = min(self.min_distance, distance)
+                self.min_distance_normalized = self.min_distance / self.max_range
+
+    def destroy(self):
+        SectorSensor.sensor_instances.pop(self, None)
+        super().destroy()
+
+
+# Burgers to be consumed by the cats
+class Burger(SimulationBaseObject):
+    __slots__ = ("energy",)
+
+    burger_instances = dict()
+    radius = 25
+    stored_fields = {"energy": ("energy", False)}
+
+    def __init__(self, energy):
+        super().__init__()
+        Burger.burger_instances[self] = None
+        self.energy = energy
+
+        self.add_tag("Burger")
+
+    def got_eaten(self, eater):
+        eater.energy += self.energy
+        self.defer_destroy()
+
+    def destroy(self):
+        Burger.burger_instances.pop(self, None)
+        super().destroy()
+
+
+class Cat(SimulationBaseObject):
+    __slots__ = (
+        "name", "alive_seconds", "ancestor_count", "total_burgers_eaten", "burger_tracker", "burger_rate",
+        "body_color", "movement_velocity", "rotation_velocity", "initial_energy", "energy",
+        "split_threshold", "evolution_options", "brain", "brain_complexity", "is_immortal", "use_brain", "sensors",
+        "sensors_range", "picture_path", "sensor_groups", "brain_slot", "brain_outputs", "species_id",
+        "rng"
+    )
+
+    # Dict used as an ordered set. Sorted by burger rate once every second
+    cat_instances = dict()
+    radius = 28
+    track_minutes = 3
+    tracker_seconds = 60 * track_minutes
+    stored_fields = {"energy": ("energy", False)}
+
+    brain_input_keys = [
+        "burger_detector_left",
+        "burger_detector_front",
+        "burger_detector_right",
+        "cat_detector_left",
+        "cat_detector_front",
+        "cat_detector_right",
+        "x",
+        "y",
+        "rotation_sin",
+        "rotation_cos",
+        "bias"
+    ]
+    brain_output_nodes = {
+        "translation_velocity": activation_functions.fun_sigmoid,
+        "rotation_velocity": activation_functions.fun_sigmoid,
+    }
+
+    # PopulationInferenceEngine evaluating the brains of every cat at once, if
+    # there's one. Otherwise each cat activates its own brain
+    brain_engine = None
+    # See Brain.network_class and Brain.phenotype_cache
+    brain_network_class = None
+    phenotype_cache = None
+
+    # SpeciesSet the cats are sorted into, if there's one, and the largest
+    # share of the population a single species is allowed to take. Cats in
+    # species that reached it don't split
+    species_set = None
+    max_species_share = 1
+
+    # Every cat gets its own RandomStream, split off this one by the number of
+    # cats created before it
+    random_stream = RandomStream()
+    cats_created = 0
+
+    def __init__(self, initial_energy, split_threshold, sensor_range, evolution_options):
+        super().__init__()
+        Cat.cat_instances[self] = None
+        self.rng = Cat.random_stream.child(Cat.cats_created)
+        Cat.cats_created += 1
+        self.name = catnames.gen() + "_" + str(self.rng.randint(0, 1000))
+        self.alive_seconds = 0
+        self.ancestor_count = 0
+        self.total_burgers_eaten = 0
+        self.burger_tracker = list()
+        self.burger_rate = 0
+        random_color = colorsys.hsv_to_rgb(self.rng.random(), 1, 1)
+        self.body_color = (
+            random_color[0] * 255,
+            random_color[1] * 255,
+            random_color[2] * 255
+        )
+        self.movement_velocity = 0
+        self.rotation_velocity = 0
+        self.initial_energy = initial_energy
+        self.energy = self.initial_energy
+        self.split_threshold = split_threshold
+        self.evolution_options = evolution_options
+        self.brain = None
+        self.brain_complexity = None
+        # Slot of the brain in brain_engine, and the outputs it computed for
+        # the present frame
+        self.brain_slot = None
+        self.brain_outputs = None
+        self.species_id = None
+        self.is_immortal = False
+        self.use_brain = True
+        self.sensors = dict()
+        self.sensors_range = sensor_range
+
+        self.add_tag("Cat")
+
+        # Pictures are only loaded by the viewer. None means no picture
+        self.picture_path = None
+        try:
+            picture_directory = os.path.join("res", "cats")
+            picture_name = self.rng.choice(sorted(os.listdir(picture_directory)))
+            self.picture_path = os.path.join(picture_directory, picture_name)
+        finally:
+            pass
+
+        burger_sensor_debug_color = (50, 255, 50)
+
+        self.sensors["burger_left"] = SectorSensor(
+            position=[0, 0],
+            rotation=math.radians(-30),
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Burger",
+            debug_color=burger_sensor_debug_color
+        )
+
+        self.sensors["burger_front"] = SectorSensor(
+            position=[0, 0],
+            rotation=0,
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Burger",
+            debug_color=burger_sensor_debug_color
+        )
+
+        self.sensors["burger_right"] = SectorSensor(
+            position=[0, 0],
+            rotation=math.radians(30),
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Burger",
+            debug_color=burger_sensor_debug_color
+        )
+
+        cat_sensor_debug_color = (255, 100, 255)
+
+        self.sensors["cat_left"] = SectorSensor(
+            position=[0, 0],
+            rotation=math.radians(-30),
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Cat",
+            debug_color=cat_sensor_debug_color,
+            ignore_object=self
+        )
+
+        self.sensors["cat_front"] = SectorSensor(
+            position=[0, 0],
+            rotation=0,
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Cat",
+            debug_color=cat_sensor_debug_color,
+            ignore_object=self
+        )
+
+        self.sensors["cat_right"] = SectorSensor(
+            position=[0, 0],
+            rotation=math.radians(30),
+            max_range=self.sensors_range,
+            fov_angle=math.radians(30),
+            detection_tag="Cat",
+            debug_color=cat_sensor_debug_color,
+            ignore_object=self
+        )
+
+        for key, sensor in self.sensors.items():
+            sensor.set_parent(self)
+
+        # Sensors grouped by the tag they look for, so every candidate object
+        # only needs to be checked once per cat
+        self.sensor_groups = dict()
+        for sensor in self.sensors.values():
+            self.sensor_groups.setdefault(sensor.detection_tag, []).append(sensor)
+
+    def set_debug_draw(self, value):
+        for sensor in self.sensors.values():
+            sensor.draw_enabled = value
+
+    def check_point_inside(self, point):
+        distance = get_distance(self.world_position, point)
+        return distance < self.radius
+
+    def new_brain(self):
+        self.brain = Brain(
+            input_keys=list(self.brain_input_keys),
+            output_nodes=dict(self.brain_output_nodes),
+            evolution_options=self.evolution_options
+        )
+        self.brain.allow_recurrency = True
+        self.brain.network_class = self.brain_network_class
+        self.brain.phenotype_cache = self.phenotype_cache
+        self.brain.rng = self.rng
+        self.brain.randomize_genotype()
+        """for i in range(0, 2):
+            self.brain.random_insert_node()"""
+        for i in range(0, int(len(self.brain.input_keys)/2)):
+            self.brain.random_new_connection()
+        self.brain.build_network()
+        self.brain_complexity = self.brain.genotype.count_enabled()
+        self.register_brain()
+        self.join_species()
+
+    def clone_brain(self, original_brain):
+        self.set_brain(original_brain.clone(self.rng))
+
+    # Gives the cat a brain as it is, without mutating it (like one that came
+    # from an archive)
+    def set_brain(self, brain):
+        self.brain = brain
+        self.brain.network_class = self.brain_network_class
+        self.brain.phenotype_cache = self.phenotype_cache
+        self.brain.rng = self.rng
+        self.brain.build_network()
+        self.brain_complexity = self.brain.genotype.count_enabled()
+        self.register_brain()
+        self.join_species()
+
+    # Puts the brain in brain_engine, replacing the one that was there before
+    def register_brain(self):
+        if Cat.brain_engine is None:
+            return
+
+        if self.brain_slot is not None:
+            Cat.brain_engine.remove(self.brain_slot)
+        self.brain_slot = Cat.brain_engine.add(self.brain.network)
+
+    def join_species(self):
+        if Cat.species_set is None:
+            return
+
+        if self.species_id is not None:
+            Cat.species_set.remove(self.species_id)
+        self.species_id = Cat.species_set.add(self.brain.genotype)
+
+    # Sorts every cat into species again (see SpeciesSet.speciate)
+    @staticmethod
+    def update_species(cats):
+        if Cat.species_set is None:
+            return
+
+        cats = list(cats)
+        species_ids = Cat.species_set.speciate([cat.brain.genotype for cat in cats])
+        for cat, species_id in zip(cats, species_ids):
+            cat.species_id = species_id
+
+    # Brain input values, in the same order as brain_input_keys
+    def get_brain_inputs(self):
+        position = self.position
+        rotation = self.rotation
+        return [
+            self.sensors["burger_left"].min_distance_normalized,
+            self.sensors["burger_front"].min_distance_normalized,
+            self.sensors["burger_right"].min_distance_normalized,
+            self.sensors["cat_left"].min_distance_normalized,
+            self.sensors["cat_front"].min_distance_normalized,
+            self.sensors["cat_right"].min_distance_normalized,
+            position[0] / self.position_constraints["max_x"],
+            position[1] / self.position_constraints["max_y"],
+            math.sin(rotation),
+            math.cos(rotation),
+            1
+        ]
+
+    # Activates the brain of every cat in cats using brain_engine. Outputs are
+    # kept by each cat until its next frame
+    @staticmethod
+    def activate_brains(cats):
+        cats = [cat for cat in cats if cat.brain_slot is not None and not cat.pending_destroy]
+        if not cats:
+            return
+
+        outputs = Cat.brain_engine.activate(
+            [cat.brain_slot for cat in cats],
+            [cat.get_brain_inputs() for cat in cats]
+        )
+
+        for cat, cat_outputs in zip(cats, outputs.tolist()):
+            cat.brain_outputs = cat_outputs
+
+    def frame(self, delta_time):
+        # Activate network, unless it was already done along with the rest of
+        # the population
+
+        if self.brain_outputs is not None:
+            translation_output, rotation_output = self.brain_outputs
+            self.brain_outputs = None
+        else:
+            network = self.brain.network
+            network.set_inputs(dict(zip(self.brain_input_keys, self.get_brain_inputs())))
+            network.activate()
+            outputs = network.get_outputs()
+            translation_output = outputs["translation_velocity"]
+            rotation_output = outputs["rotation_velocity"]
+
+        if self.use_brain:
+            self.movement_velocity = (translation_output - 0.5) * 400
+            self.rotation_velocity = (rotation_output - 0.5) * (math.pi * 4)
+
+        # Move and split
+
+        rotation_increment = self.rotation_velocity * delta_time
+
+        movement_magnitude = self.movement_velocity * delta_time
+
+        movement_delta_x = math.cos(self.rotation) * movement_magnitude
+        movement_delta_y = math.sin(self.rotation) * movement_magnitude
+
+        movement_vector = [movement_delta_x, movement_delta_y]
+
+        self.increment_position_rotation(movement_vector, rotation_increment)
+
+        movement_cost = abs(movement_magnitude) / 100
+        rotation_cost = abs(rotation_increment) / (math.pi * 2)
+        time_cost = delta_time
+        self.energy -= movement_cost + rotation_cost + time_cost
+
+        if self.energy > self.split_threshold:
+            SimulationBaseObject.registry.defer(self.split)
+
+        # Check if cat is dead
+
+        if self.energy <= 0:
+            if not self.is_immortal:
+                self.defer_destroy()
+            else:
+                self.energy = 0
+
+        # Check if there's something to eat. Sensors are read later, once
+        # every cat moved (see update_sensors)
+
+        nearby_burgers = self.perceive(use_sensors=False)
+
+        for instance, distance in nearby_burgers:
+            if distance < (self.radius + instance.radius + 30):
+                self.energy += (time_cost * 2)
+            if distance < (self.radius + instance.radius):
+                instance.got_eaten(self)
+
+                self.total_burgers_eaten += 1
+
+                self.burger_tracker.append(self.tracker_seconds)
+
+        # Upgrade burger rate
+
+        self.burger_rate = len(self.burger_tracker)
+
+    # Single perception step. The distance and bearing to every object around
+    # the cat are computed once, and shared by all the sensors looking for it
+    # (they all sit at the cat's center).
+    # It returns a list of (burger, distance) pairs for the burgers close
+    # enough to give energy or to be eaten
+    def perceive(self, use_sensors=True):
+        proximity_range = self.radius + Burger.radius + 30
+        nearby_burgers = []
+
+        search_ranges = dict()
+        if use_sensors:
+            for tag, group in self.sensor_groups.items():
+                for sensor in group:
+                    sensor.reset_reading()
+                search_ranges[tag] = max(sensor.max_range for sensor in group)
+        search_ranges["Burger"] = max(search_ranges.get("Burger", 0), proximity_range)
+
+        origin = self.world_position
+        for tag, search_range in search_ranges.items():
+            group = self.sensor_groups.get(tag, []) if use_sensors else []
+
+            for instance in SimulationBaseObject.grid.query(tag, origin, search_range):
+                # Objects about to be destroyed are already gone for everybody else
+                if instance is self or instance.pending_destroy:
+                    continue
+
+                distance_x = instance.world_position[0] - origin[0]
+                distance_y = instance.world_position[1] - origin[1]
+                distance = math.sqrt((distance_x ** 2) + (distance_y ** 2))
+
+                if tag == "Burger" and distance < proximity_range:
+                    nearby_burgers.append((instance, distance))
+
+                if group and distance < search_range:
+                    bearing = math.atan2(distance_y, distance_x)
+                    for sensor in group:
+                        if instance is not sensor.ignore_object:
+                            sensor.register_detection(distance, bearing)
+
+        return nearby_burgers
+
+    # Fills the sensor readings of every cat in cats, one cat at a time. Like
+    # a BatchSensorEngine, it's meant to run after every cat moved and ate, so
+    # they all see the same world
+    @staticmethod
+    def update_sensors(cats):
+        for cat in cats:
+            if not cat.pending_destroy:
+                cat.perceive()
+
+    def destroy(self):
+        Cat.cat_instances.pop(self, None)
+        if self.brain_slot is not None:
+            Cat.brain_engine.remove(self.brain_slot)
+            self.brain_slot = None
+        if self.species_id is not None:
+            Cat.species_set.remove(self.species_id)
+            self.species_id = None
+        super().destroy()
+
+    def call_every_second(self):
+        self.alive_seconds += 1
+        for index in range(0, len(self.burger_tracker)):
+            self.burger_tracker[index] -= 1
+        self.burger_tracker = [number for number in self.burger_tracker if number > 0]
+
+    def split(self):
+        # The species is already as big as it's allowed to be
+        if Cat.species_set is not None and self.species_id is not None and not Cat.species_set.has_room(
+                self.species_id, len(Cat.cat_instances), Cat.max_species_share
+        ):
+            self.energy = min(self.energy, self.split_threshold)
+            return
+
+        new_cat = Cat(
+            self.initial_energy,
+            self.split_threshold,
+            self.sensors_range,
+            self.evolution_options
+        )
+
+        self.energy -= new_cat.energy
+        new_cat.position = self.position
+        new_cat.rotation = self.rotation
+        new_cat.set_parent(self.parent)
+        new_cat.position_constraints = self.position_constraints
+        new_cat.ancestor_count = self.ancestor_count + 1
+        new_cat.clone_brain(self.brain)
+
+
+class Arena(SimulationBaseObject):
+    def __init__(self, width, height):
+        super().__init__()
+        self.limits = dict()
+        self.width = width
+        self.height = height
+
+        self.limits["min_x"] = -self.width / 2
+        self.limits["max_x"] = self.width / 2
+        self.limits["min_y"] = -self.height / 2
+        self.limits["max_y"] = self.height / 2
+
+
+class Simulation:
+    def __init__(self):
+
+        self.evolution_options = EvolutionOptions()
+
+        ##############################################################################
+        #          Change these settings to configure the evolution process          #
+        ##############################################################################
+        # Maximum amount of burgers that can exist at the same time
+        self.max_burgers = 10
+
+        # How often (in milliseconds) will burgers appear, if there are
+        # less than max_burgers
+        self.burger_timer_period = 1000
+
+        # Minimum amount of cats. Random cats will appear if there are less
+        # than this number
+        self.min_cats = 15
+
+        # How far away (in pixels) will cats be capable of seeing burgers and other
+        # cats
+        self.sensor_max_range = 400
+
+        # How much energy a cat gains after eating a burger
+        self.burger_energy = 40
+
+        # How much energy a cat has when it spawns
+        self.initial_cat_energy = 40
+
+        # Cats will split when they reach this amount of energy
+        # Parent cat will lose initial_cat_energy after doing it
+        self.cat_split_threshold = 300
+
+        # All probabilities are represented with a number between 0(0%) and 1(100%)
+
+        # How likely is it for a gene to be mutated (Either connection gene or node
+        # gene)
+        self.evolution_options.gene_mutation_probability = 0.1
+
+        # How likely it is for a mutated connection gene to change it's weight by
+        # adding perturbation_delta
+        self.evolution_options.weight_perturbation_probability = 0.8
+
+        # perturbation_delta is a random number chosen such that
+        # -perturbation_max_delta < perturbation_delta < perturbation_max_delta
+        self.evolution_options.weight_perturbation_max_delta = 0.5
+
+        # If a gene is not mutated by adding perturbation_delta, then it will be
+        # asigned a random number chosen such that
+        # -weight_random_mutation_range < number < weight_random_mutation_range
+        self.evolution_options.weight_random_mutation_range = 3
+
+        # How likely it is for a connection gene to be disabled
+        self.evolution_options.connection_disable_probability = 0.001
+
+        # How likely it is to insert a new node that splits an existing connection
+        # when a cat splits
+        self.evolution_options.node_insertion_chance = 0.1
+
+        # How likely it is to create a new connection between existing nodes
+        # when a cat splits
+        self.evolution_options.new_connection_chance = 0.1
+
+        # Available activation functions. Nodes will have an activation function
+        # chosen at random from this list when they are created, or when an
+        # existing node is mutated. More activation functions can be appended
+        # to this list if desired.
+        self.evolution_options.activation_functions.append(activation_functions.fun_sigmoid)
+
+        ##############################################################################
+
+        # Evaluate every sensor at once using NumPy, instead of one at a time.
+        # It's much faster when there are lots of cats
+        self.batch_sensing = True
+
+        # Evaluate the brains of every cat at once using NumPy, instead of one
+        # at a time
+        self.batch_brains = True
+
+        # Split the sensing and brains of the cats among this many worker
+        # processes (see parallel_tick). Results don't change, but it only
+        # pays off with lots of cats. Needs batch_sensing and batch_brains,
+        # and can't be used by islands (which already are worker processes).
+        # 0 does everything in this process
+        self.worker_processes = 0
+
+        # Generate Python code for every brain structure, instead of going
+        # through NumPy arrays. It's faster for brains evaluated one at a time,
+        # so it only makes a difference with batch_brains off
+        self.generate_brain_code = False
+
+        # Memory (in megabytes) used to keep built brain networks, so cats
+        # with the same genes can share them instead of building their own.
+        # 0 turns it off
+        self.phenotype_cache_megabytes = 64
+
+        # Seed for every random thing in the simulation, so runs can be
+        # repeated. None picks a different one every time
+        self.world_seed = None
+
+        # Sort cats into species by how different their genes are (see
+        # SpeciesSet). Species are updated once every second
+        self.use_species = True
+
+        # How different two cats have to be to belong to different species
+        self.species_compatibility_threshold = 3.0
+
+        # Largest share of the population a single species can take (between
+        # 0 and 1). Cats whose species reached it won't split. 1 means no limit
+        self.max_species_share = 1
+
+        # Keep the state of every object in NumPy arrays (see EntityStore), so
+        # it can be processed in bulk
+        self.use_entity_store = False
+
+        # Size of the world. The arena leaves room on the right for the
+        # viewer's leaderboard
+        self.width = 1440
+        self.height = 900
+        self.arena_margin = 260
+
+        # Simulated seconds per step. Every step is this long, no matter how
+        # fast the simulation is being run, so runs with the same seed always
+        # go the same way
+        self.delta_time = 1 / 60
+
+        # Steps taken and simulated seconds since the simulation started
+        self.steps = 0
+        self.time = 0
+        # Simulated seconds given to advance that didn't make a whole step yet
+        self.pending_time = 0
+
+        # Things that happen at given simulated times, like burgers spawning
+        self.scheduler = Scheduler()
+
+        # Best cats by burger rate, updated once every second
+        self.leaders = []
+
+        self.world_random = None
+        self.burger_random = None
+        self.spawn_random = None
+        self.sensor_engine = None
+        self.worker_pool = None
+        self.root = None
+        self.arena = None
+
+    # Builds the world using the settings above. Settings should be changed
+    # before calling it. Anything left by another simulation is forgotten
+    def start(self):
+        self.reset_world()
+
+        SimulationBaseObject.set_entity_store(EntityStore() if self.use_entity_store else None)
+        self.sensor_engine = BatchSensorEngine()
+        if self.worker_processes > 0:
+            self.worker_pool = WorkerPool(self.worker_processes)
+            self.sensor_engine = ParallelSensorEngine(self.worker_pool)
+
+        if self.generate_brain_code:
+            Cat.brain_network_class = nn.GeneratedNetwork
+
+        if self.phenotype_cache_megabytes > 0:
+            Cat.phenotype_cache = PhenotypeCache(self.phenotype_cache_megabytes * 1024 * 1024)
+
+        # Every part of the simulation draws from its own stream, split off
+        # the world one
+        self.world_random = RandomStream(self.world_seed)
+        self.burger_random = self.world_random.child("burgers")
+        self.spawn_random = self.world_random.child("spawn")
+        Cat.random_stream = self.world_random.child("cats")
+        Cat.cats_created = 0
+        # Cat names come from catnames, which uses the random module
+        random.seed(self.world_random.child("names").getrandbits(64))
+
+        if self.use_species:
+            Cat.species_set = SpeciesSet(self.species_compatibility_threshold)
+            Cat.species_set.rng = self.world_random.child("species")
+            Cat.max_species_share = self.max_species_share
+
+        if self.batch_brains and self.worker_pool is not None:
+            Cat.brain_engine = ShardedInferenceEngine(
+                self.worker_pool,
+                Cat.brain_input_keys,
+                Cat.brain_output_nodes
+            )
+        elif self.batch_brains:
+            Cat.brain_engine = PopulationInferenceEngine(
+                Cat.brain_input_keys,
+                Cat.brain_output_nodes
+            )
+
+        self.root = SimulationBaseObject()
+        self.root.set_position_rotation([self.width / 2, self.height / 2])
+
+        self.arena = Arena(self.width - self.arena_margin, self.height)
+        self.arena.set_parent(self.root)
+        self.arena.set_position_rotation([-(self.arena_margin / 2), 0])
+
+        self.spawn_burgers(self.max_burgers)
+        self.spawn_random_cats(self.min_cats)
+
+        self.scheduler.schedule_every(1, self.every_second, self.time)
+        # A dedicated timer for burger spawning. It allows to controll the burger spawn
+        # rate independently from other things
+        self.scheduler.schedule_every(self.burger_timer_period / 1000, self.burger_timer, self.time)
+
+    # Stops the worker processes, if there are any, and tears the world down,
+    # so another simulation can be started in this process
+    def stop(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool = None
+
+        self.reset_world()
+        SimulationBaseObject.set_entity_store(None)
+        self.sensor_engine = None
+        self.root = None
+        self.arena = None
+        self.leaders = []
+
+    # Simulation objects, and the things shared by them, live in class
+    # attributes. This drops all of them, leaving an empty world
+    def reset_world(self):
+        SimulationBaseObject.registry = EntityRegistry()
+        SimulationBaseObject.tag_members = dict()
+        # Sensors only need to look at the cells around them, so a cell size
+        # close to their range keeps lookups small
+        SimulationBaseObject.grid.reset(self.sensor_max_range / 2)
+
+        SectorSensor.sensor_instances = dict()
+        Burger.burger_instances = dict()
+        Cat.cat_instances = dict()
+
+        Cat.brain_engine = None
+        Cat.brain_network_class = None
+        Cat.phenotype_cache = None
+        Cat.species_set = None
+        Cat.max_species_share = 1
+
+    def spawn_burgers(self, number):
+        for i in range(0, number):
+            burger = Burger(self.burger_energy)
+            x = self.burger_random.randint(self.arena.limits["min_x"], self.arena.limits["max_x"])
+            y = self.burger_random.randint(self.arena.limits["min_y"], self.arena.limits["max_y"])
+            burger.set_parent(self.arena)
+            burger.set_position_rotation([x, y], 0)
+
+    def spawn_random_cats(self, number):
+        for i in range(0, number):
+            self.spawn_cat()
+
+    # Spawns a cat at a random place. It gets brain if there's one (see
+    # Cat.set_brain), or a new random brain
+    def spawn_cat(self, brain=None):
+        cat = Cat(
+            self.initial_cat_energy,
+            self.cat_split_threshold,
+            self.sensor_max_range,
+            self.evolution_options
+        )
+
+        cat.set_parent(self.arena)
+        cat.position_constraints = self.arena.limits
+        if brain is None:
+            cat.new_brain()
+        else:
+            cat.set_brain(brain)
+
+        half_width = int(self.width / 2)
+        half_height = int(self.height / 2)
+
+        position = [
+            self.spawn_random.randint(-half_width, half_width),
+            self.spawn_random.randint(-half_height, half_height)
+        ]
+
+        rotation = self.spawn_random.uniform(0, math.radians(360))
+
+        cat.set_position_rotation(position, rotation)
+
+        return cat
+
+    # Some things only get updated once every second
+    def every_second(self):
+        Cat.cat_instances = dict.fromkeys(
+            sorted(Cat.cat_instances, key=lambda this_cat: this_cat.burger_rate, reverse=True)
+        )
+        for cat in Cat.cat_instances:
+            cat.call_every_second()
+        Cat.update_species(Cat.cat_instances)
+
+        self.leaders = list(Cat.cat_instances)[0:5]
+
+        if len(Cat.cat_instances) < self.min_cats:
+            SimulationBaseObject.registry.defer(self.spawn_random_cats, 1)
+
+    def burger_timer(self):
+        if len(Burger.burger_instances) < self.max_burgers:
+            SimulationBaseObject.registry.defer(self.spawn_burgers, 1)
+
+    # Moves the simulation one step (delta_time seconds) forward
+    def step(self):
+        self.steps += 1
+        # Counting steps instead of adding up delta_time keeps rounding errors
+        # from piling up
+        self.time = self.steps * self.delta_time
+        self.scheduler.run_until(self.time)
+
+        # Spawns and deaths are queued while objects are being processed,
+        # and applied between phases
+        SimulationBaseObject.registry.flush()
+
+        if self.batch_brains:
+            Cat.activate_brains(Cat.cat_instances)
+
+        for instance in SimulationBaseObject.registry:
+            instance.frame(self.delta_time)
+
+        SimulationBaseObject.registry.flush()
+
+        if self.batch_sensing:
+            self.sensor_engine.run(SectorSensor.sensor_instances, SimulationBaseObject.tag_members)
+        else:
+            Cat.update_sensors(Cat.cat_instances)
+
+    # Takes as many steps as fit in some simulated seconds. What's left is
+    # kept for the next call, so the simulation keeps up on average. Returns
+    # the number of steps taken
+    def advance(self, seconds):
+        self.pending_time += seconds
+        steps = int(self.pending_time / self.delta_time)
+        self.pending_time -= steps * self.delta_time
+        for i in range(steps):
+            self.step()
+
+        return steps
+
+    # Runs the simulation for some simulated seconds, as fast as possible
+    def run(self, seconds):
+        for i in range(round(seconds / self.delta_time)):
+            self.step()
+
+
+# Runs without a display, printing how things are going every simulated minute
+if __name__ == '__main__':
+    simulation = Simulation()
+    simulation.start()
+    while True:
+        start = time.perf_counter()
+        simulation.run(60)
+        print("{} simulated: {} cats, {} species, {} burgers ({:.2f} s)".format(
+            int_to_hms_string(int(simulation.time)),
+            len(Cat.cat_instances),
+            metrics.get_gauge("species.count", 0),
+            len(Burger.burger_instances),
+            time.perf_counter() - start
+        ))
@@ -0,0 +1,92 @@
+import math
+
+
+# A uniform grid laid over the world. Every tagged object is stored in the cell
+# that contains its world position, once for each of its tags, so a lookup only
+# has to visit the few cells that overlap the searched area instead of every
+# object in the simulation.
+
+class SpatialHashGrid:
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+
+        # tag -> cell key -> objects inside that cell
+        # Dicts are used as insertion ordered sets, so lookups are deterministic
+        self.buckets = dict()
+
+        # object -> (cell key, tags it was stored with)
+        self.object_cells = dict()
+
+    def get_cell_key(self, position):
+        return (
+            math.floor(position[0] / self.cell_size),
+            math.floor(position[1] / self.cell_size)
+        )
+
+    # Inserts an object, or moves it to another cell if its position changed.
+    # Objects without tags are never stored, since nothing can look for them
+    def update(self, instance):
+        if not instance.tags:
+            return
+
+        key = self.get_cell_key(instance.world_position)
+
+        previous = self.object_cells.get(instance)
+        if previous is not None:
+            if previous[0] == key:
+                return
+            self.remove(instance)
+
+        tags = tuple(instance.tags)
+        for tag in tags:
+            cells = self.buckets.setdefault(tag, dict())
+            cells.setdefault(key, dict())[instance] = None
+
+        self.object_cells[instance] = (key, tags)
+
+    def remove(self, instance):
+        previous = self.object_cells.pop(instance, None)
+        if previous is None:
+            return
+
+        key, tags = previous
+        for tag in tags:
+            cells = self.buckets[tag]
+            del cells[key][instance]
+            # Drop empty cells so they don't pile up as objects wander around
+            if not cells[key]:
+                del cells[key]
+
+    # Returns a list with every object containing tag whose cell overlaps the
+    # square that encloses the circle defined by position and radius.
+    # It's up to the caller to check the exact distance.
+    def query(self, tag, position, radius):
+        cells = self.buckets.get(tag)
+        if not cells:
+            return []
+
+        min_x, min_y = self.get_cell_key([position[0] - radius, position[1] - radius])
+        max_x, max_y = self.get_cell_key([position[0] + radius, position[1] + radius])
+
+        found = []
+        # Iterating the occupied cells is cheaper when the area covers most of them
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):
+            for key, cell in cells.items():
+                if min_x <= key[0] <= max_x and min_y <= key[1] <= max_y:
+                    found.extend(cell)
+        else:
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    cell = cells.get((x, y))
+                    if cell is not None:
+                        found.extend(cell)
+
+        return found
+
+    # Empties the grid and changes its cell size. Objects will need to be
+    # inserted again
+    def reset(self, cell_size):
+        self.cell_size = cell_size
+        self.buckets = dict()
+        self.object_cells = dict()
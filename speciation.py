@@ -0,0 +1,317 @@
+import numpy as np
+
+import metrics
+import random_streams
+from genome import CONNECTION
+
+
+# NEAT style species.
+#
+# Two genomes are compared gene by gene, aligning genes by innovation number.
+# Genes with the same innovation number match when they also describe the same
+# gene (same type and same nodes), since innovation numbers are only unique
+# within a lineage. The rest are excess genes (past the last innovation number
+# of the other genome) or disjoint genes. The compatibility distance is
+#
+#     excess_coefficient * excess / N + disjoint_coefficient * disjoint / N +
+#     weight_coefficient * (mean weight difference of matching connections)
+#
+# where N is the size of the largest genome, or 1 for small genomes.
+#
+# Every genome is put in the species with the closest representative, if it's
+# closer than compatibility_threshold, or starts a new one.
+# Distances are computed for many genomes against many representatives at
+# once: genes are laid out in matrices with one column per innovation number,
+# so every comparison is a few NumPy operations.
+
+class SpeciesSet:
+
+    def __init__(self, compatibility_threshold=3.0, excess_coefficient=1.0, disjoint_coefficient=1.0,
+                 weight_coefficient=0.4):
+        self.compatibility_threshold = compatibility_threshold
+        self.excess_coefficient = excess_coefficient
+        self.disjoint_coefficient = disjoint_coefficient
+        self.weight_coefficient = weight_coefficient
+
+        # Genomes with fewer genes than this are not normalized by their size
+        self.small_genome_size = 20
+        # Maximum number of gene pairs compared at once, to keep memory bounded
+        self.max_chunk_size = 1 << 22
+        # Genomes that start new species are looked for this many at a time
+        self.new_species_block_size = 64
+
+        # species id -> genome representing the species, and its genes (see
+        # get_genes)
+        self.representatives = dict()
+        self.representative_genes = dict()
+        # Columns and gene table of the representatives, in species order. None
+        # when it has to be built again
+        self.representative_table = None
+        # species id -> number of members
+        self.sizes = dict()
+        self.next_species_id = 0
+
+        # Node key -> number used in gene signatures
+        self.key_ids = dict()
+
+        # (Optional) RandomStream used to choose representatives
+        self.rng = random_streams.default_stream
+
+    def __len__(self):
+        return len(self.representatives)
+
+    # Innovation numbers, signatures, weights and connection flags of every
+    # gene of a genome. Signatures are numbers, equal for genes that describe
+    # the same gene
+    def get_genes(self, genome):
+        count = genome.count
+        key_ids = np.array([self.key_ids.setdefault(key, len(self.key_ids)) for key in genome.node_keys] or [0])
+        signatures = (
+            (genome.types[:count].astype(np.int64) << 62) |
+            (key_ids[genome.in_nodes[:count]].astype(np.int64) << 31) |
+            key_ids[genome.out_nodes[:count]].astype(np.int64)
+        )
+        return genome.innovations[:count], signatures, genome.weights[:count], genome.types[:count] == CONNECTION
+
+    # Genes of several genomes (as returned by get_genes), one row per genome
+    # and one column per innovation number in columns (sorted). Missing genes
+    # get the signature -1
+    def get_gene_table(self, genome_genes, columns):
+        signatures = np.full((len(genome_genes), len(columns)), -1, dtype=np.int64)
+        weights = np.zeros((len(genome_genes), len(columns)))
+        connections = np.zeros((len(genome_genes), len(columns)), dtype=bool)
+
+        for index, (gene_innovations, gene_signatures, gene_weights, gene_connections) in enumerate(genome_genes):
+            gene_columns = np.searchsorted(columns, gene_innovations)
+            signatures[index, gene_columns] = gene_signatures
+            weights[index, gene_columns] = gene_weights
+            connections[index, gene_columns] = gene_connections
+
+        present = signatures >= 0
+        # Number of genes up to (and including) every column
+        genes_up_to = np.cumsum(present, axis=1)
+        if not len(columns):
+            return signatures, weights, connections, genes_up_to, np.zeros(len(genome_genes), dtype=np.intp), \
+                np.full(len(genome_genes), -1)
+
+        gene_counts = genes_up_to[:, -1]
+        # Column of the last gene, or -1
+        last_columns = len(columns) - 1 - np.argmax(present[:, ::-1], axis=1)
+        last_columns[gene_counts == 0] = -1
+
+        return signatures, weights, connections, genes_up_to, gene_counts, last_columns
+
+    # A gene table with more columns (new_columns has every column in
+    # columns)
+    @staticmethod
+    def expand_gene_table(table, columns, new_columns):
+        signatures, weights, connections, genes_up_to, gene_counts, last_columns = table
+        positions = np.searchsorted(new_columns, columns)
+
+        new_signatures = np.full((len(signatures), len(new_columns)), -1, dtype=np.int64)
+        new_signatures[:, positions] = signatures
+        new_weights = np.zeros((len(signatures), len(new_columns)))
+        new_weights[:, positions] = weights
+        new_connections = np.zeros((len(signatures), len(new_columns)), dtype=bool)
+        new_connections[:, positions] = connections
+        new_last_columns = last_columns
+        if len(columns):
+            new_last_columns = np.where(last_columns >= 0, positions[np.maximum(last_columns, 0)], -1)
+
+        return (
+            new_signatures, new_weights, new_connections, np.cumsum(new_signatures >= 0, axis=1), gene_counts,
+            new_last_columns
+        )
+
+    # Gene table of the representatives, with columns for every innovation
+    # number in genome_genes as well. Returns the columns and the table
+    def get_representative_table(self, species, genome_genes):
+        if self.representative_table is None:
+            representative_genes = [self.representative_genes[s] for s in species]
+            columns = self.get_columns(representative_genes)
+            self.representative_table = (columns, self.get_gene_table(representative_genes, columns))
+
+        columns, table = self.representative_table
+        new_columns = np.union1d(columns, self.get_columns(genome_genes))
+        if len(new_columns) == len(columns):
+            return columns, table
+        return new_columns, self.expand_gene_table(table, columns, new_columns)
+
+    # Some rows of a gene table
+    @staticmethod
+    def get_table_rows(table, rows):
+        return tuple(array[rows] for array in table)
+
+    @staticmethod
+    def get_columns(genome_genes):
+        if not genome_genes:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([genes[0] for genes in genome_genes]))
+
+    # Compatibility distances between every genome and every representative,
+    # as a matrix with one row per genome. Both are given as lists of genes
+    # (see get_genes)
+    def get_distances(self, genome_genes, representative_genes):
+        columns = self.get_columns(genome_genes + representative_genes)
+        return self.get_table_distances(
+            self.get_gene_table(genome_genes, columns),
+            self.get_gene_table(representative_genes, columns)
+        )
+
+    # Same as get_distances, with genes given as gene tables sharing the same
+    # columns
+    def get_table_distances(self, table, representative_table):
+        representative_signatures, representative_weights, representative_connections, \
+            representative_genes_up_to, representative_counts, representative_last = representative_table
+
+        genome_count, column_count = table[0].shape
+        representative_count = len(representative_signatures)
+        distances = np.zeros((genome_count, representative_count))
+        if genome_count == 0 or representative_count == 0:
+            return distances
+
+        chunk_rows = max(1, self.max_chunk_size // max(1, representative_count * column_count))
+        for start in range(0, genome_count, chunk_rows):
+            end = min(start + chunk_rows, genome_count)
+            signatures, weights, connections, genes_up_to, counts, last = \
+                self.get_table_rows(table, slice(start, end))
+
+            # genome, representative, column
+            matches = (signatures[:, None, :] == representative_signatures[None, :, :]) & \
+                (signatures >= 0)[:, None, :]
+            match_counts = np.count_nonzero(matches, axis=2)
+            connection_matches = matches & connections[:, None, :]
+            connection_match_counts = np.count_nonzero(connection_matches, axis=2)
+            weight_differences = np.abs(weights[:, None, :] - representative_weights[None, :, :])
+            weight_differences = np.where(connection_matches, weight_differences, 0).sum(axis=2)
+            mean_weight_differences = weight_differences / np.maximum(connection_match_counts, 1)
+
+            # Excess genes are the genes of the longer genome past the last
+            # gene of the shorter one
+            genome_longer = last[:, None] > representative_last[None, :]
+            genome_excess = counts[:, None] - np.where(
+                representative_last >= 0,
+                genes_up_to[:, np.maximum(representative_last, 0)],
+                0
+            )
+            representative_excess = representative_counts[None, :] - np.where(
+                last[:, None] >= 0,
+                representative_genes_up_to[:, np.maximum(last, 0)].T,
+                0
+            )
+            excess = np.where(genome_longer, genome_excess, representative_excess)
+            disjoint = counts[:, None] + representative_counts[None, :] - 2 * match_counts - excess
+
+            sizes = np.maximum(counts[:, None], representative_counts[None, :])
+            sizes = np.where(sizes < self.small_genome_size, 1, sizes)
+
+            distances[start:end] = (
+                self.excess_coefficient * excess / sizes +
+                self.disjoint_coefficient * disjoint / sizes +
+                self.weight_coefficient * mean_weight_differences
+            )
+
+        return distances
+
+    def new_species(self, genome, genes):
+        species_id = self.next_species_id
+        self.next_species_id += 1
+        self.representatives[species_id] = genome
+        self.representative_genes[species_id] = genes
+        self.representative_table = None
+        self.sizes[species_id] = 0
+        metrics.increment("species.created")
+
+        return species_id
+
+    # Species id of every genome, creating new species when needed. Genomes
+    # that are not close enough to any species start new ones, in order, and
+    # the genomes after them join the first new species they are close enough
+    # to. genome_genes can be given if they were already computed
+    def assign(self, genomes, genome_genes=None):
+        if genome_genes is None:
+            genome_genes = [self.get_genes(genome) for genome in genomes]
+        species_ids = [None] * len(genomes)
+
+        species = list(self.representatives.keys())
+        columns, representative_table = self.get_representative_table(species, genome_genes)
+        table = self.get_gene_table(genome_genes, columns)
+
+        pending = np.arange(len(genomes))
+        if species:
+            distances = self.get_table_distances(table, representative_table)
+            closest = np.argmin(distances, axis=1)
+            compatible = distances[np.arange(len(genomes)), closest] < self.compatibility_threshold
+            for index in np.flatnonzero(compatible).tolist():
+                species_ids[index] = species[closest[index]]
+            pending = np.flatnonzero(~compatible)
+
+        # New species are looked for in blocks of pending genomes. The pending
+        # genomes are compared against the whole block at once, then the block
+        # is gone through in order
+        while len(pending):
+            block = pending[:self.new_species_block_size]
+            distances = self.get_table_distances(
+                self.get_table_rows(table, pending),
+                self.get_table_rows(table, block)
+            )
+            compatible = distances < self.compatibility_threshold
+
+            pending_ids = [None] * len(pending)
+            for position, index in enumerate(block.tolist()):
+                if pending_ids[position] is not None:
+                    continue
+
+                species_id = self.new_species(genomes[index], genome_genes[index])
+                for member in np.flatnonzero(compatible[:, position]).tolist():
+                    if pending_ids[member] is None:
+                        pending_ids[member] = species_id
+
+            for index, species_id in zip(pending.tolist(), pending_ids):
+                species_ids[index] = species_id
+            pending = pending[[species_id is None for species_id in pending_ids]]
+
+        for species_id in species_ids:
+            self.sizes[species_id] += 1
+
+        return species_ids
+
+    # Adds a single genome (like a newborn) to its species, and returns its id
+    def add(self, genome):
+        species_id = self.assign([genome])[0]
+        self.report()
+        return species_id
+
+    def remove(self, species_id):
+        self.sizes[species_id] -= 1
+
+    # Assigns every genome of the population again, from scratch. Species
+    # keep going as long as they have members, and a random member becomes
+    # their new representative. Returns the species id of every genome
+    def speciate(self, genomes):
+        self.sizes = dict.fromkeys(self.representatives, 0)
+        genome_genes = [self.get_genes(genome) for genome in genomes]
+        species_ids = self.assign(genomes, genome_genes)
+
+        members = dict()
+        for index, species_id in enumerate(species_ids):
+            members.setdefault(species_id, []).append(index)
+
+        representatives = {species_id: self.rng.choice(members[species_id]) for species_id in members}
+        self.representatives = {species_id: genomes[index] for species_id, index in representatives.items()}
+        self.representative_genes = {species_id: genome_genes[index] for species_id, index in representatives.items()}
+        self.representative_table = None
+        self.sizes = {species_id: len(members[species_id]) for species_id in members}
+        self.report()
+
+        return species_ids
+
+    # Whether a species can get a new member without having more than
+    # max_share of a population of population_size
+    def has_room(self, species_id, population_size, max_share):
+        return self.sizes.get(species_id, 0) + 1 <= max(1, max_share * population_size)
+
+    def report(self):
+        sizes = [size for size in self.sizes.values() if size > 0]
+        metrics.set_gauge("species.count", len(sizes))
+        metrics.set_gauge("species.largest", max(sizes, default=0))